@@ -9,15 +9,42 @@
 # ======================================================================================
 
 from src.entries import readandmakeentries
-from src.helper import llm, compute_dominant_emotion, extract_entry_date, extract_clean_emotion
-from src.contextualencoder import encoder
+from src.helper import llm, compute_dominant_emotion, extract_entry_date, extract_clean_emotion, response_timing_report
+from src.contextualencoder import encoder, split_entries_into_sentences
 from src.emotionaltagger import emotional_tagging
-from src.memory_storage import store_memory
+from src.memory_storage import store_memory, SQLiteMemoryStack
 from src.entity_extractor import extract_entities
 from src.learn import predict_emotion, learn_from_emotional_error, generate_bias_shift_report
 from src.attachmentmodeling import AuthorityAttachmentModel
+from src.results_io import ResultsWriter
+from src.dedup import PerceptionDeduplicator
+from src.structured_output import parse_failure_report
+from src.replay import PerceptionRecorder, load_recording
 from tqdm import tqdm
-import json
+import os
+
+# --- Output format for saved results: "jsonl" (default) or "msgpack".
+RESULTS_FORMAT = "jsonl"
+
+# --- Max SimHash bit distance for two sentences to count as near-duplicates
+# (0 = exact normalized matches only). Measured on the 520 distinct diary sentences
+# of 4+ tokens: a one-word insertion or deletion moves a fingerprint a median 7 bits
+# (65-70% land within 8) and a one-word substitution 9 bits (48% within 8), while the
+# closest pair of unrelated sentences is 11 bits apart. The risk at 8 is that a
+# sentence differing only by one small word, e.g. "not", reuses the other's tags.
+DEDUP_THRESHOLD = 8
+
+# --- Perception outputs are recorded here for offline parameter sweeps (src/replay.py).
+REPLAY_RECORDING = "results/perception_replay.jsonl"
+
+# --- Optional SQLite-backed memory stack. Phase 1 output (memories, attachment
+# graphs and the Phase 1 perception records) is snapshotted to MEMORY_SEED_PATH;
+# with WARM_START, a later run copies that seed into MEMORY_STORE_PATH, skips
+# Phase 1 and goes straight to Phase 2. The seed itself is never modified, so every
+# warm start begins from the same Phase 1 state.
+MEMORY_STORE_PATH = None  # e.g. "results/memory.db"
+MEMORY_SEED_PATH = "results/memory_seed.db"
+WARM_START = False
 
 # --- Global logs for tracking agent's learning and internal state.
 contradiction_log = []
@@ -38,16 +65,47 @@ emotional_memory_stack = {
     }
 }
 
-# --- Initialize the Relationship Modeling module (RM).
+# --- Swap in the disk-backed store when configured; it has the same interface.
+warm_start = False
+if MEMORY_STORE_PATH is not None:
+    if WARM_START and os.path.exists(MEMORY_SEED_PATH):
+        seed = SQLiteMemoryStack(MEMORY_SEED_PATH, read_only=True)
+        warm_start = len(seed["Memory List"]) > 0
+        seed.close()
+    if warm_start:
+        emotional_memory_stack = SQLiteMemoryStack.from_snapshot(MEMORY_SEED_PATH, MEMORY_STORE_PATH)
+    else:
+        emotional_memory_stack = SQLiteMemoryStack(MEMORY_STORE_PATH)
+        emotional_memory_stack.clear()
+
+# --- Initialize the Relationship Modeling module (RM), restoring its Phase 1 graphs on a warm start.
 attachment_model = AuthorityAttachmentModel()
+if warm_start:
+    attachment_model = AuthorityAttachmentModel.from_edge_records(emotional_memory_stack.get_meta("attachment_graphs", []))
 
 # --- Load and partition the dataset from Anne Frank's diary.
 entries = readandmakeentries("data\\the-diary-of-anne-frank.pdf")
 phase1entries = entries[1:8]
 phase2entries = entries[8:13]
+if warm_start:
+    phase1entries = []
+
+# --- Segment every entry up front in one batched spaCy pass.
+phase1sentences = split_entries_into_sentences(phase1entries)
+phase2sentences = split_entries_into_sentences(phase2entries)
 
 client = llm()
 eventid = 0
+if warm_start:
+    eventid = emotional_memory_stack.get_meta("last_event_id", 0)
+    print(f"Warm start: loaded {len(emotional_memory_stack['Memory List'])} seeded memories from {MEMORY_SEED_PATH}")
+
+# --- Reuses perception results for repeated and near-identical sentences.
+dedup = PerceptionDeduplicator(threshold=DEDUP_THRESHOLD)
+recorder = PerceptionRecorder(REPLAY_RECORDING)
+if warm_start:
+    # Phase 1 is skipped, so carry its records over to keep the recording replayable.
+    recorder.extend(emotional_memory_stack.get_meta("phase1_recording", []))
 
 print("=" * 60)
 print("PHASE 1: BUILDING INITIAL EMOTIONAL MODEL (MODEL SEEDING)")
@@ -62,12 +120,16 @@ for entry_idx, entry in enumerate(phase1entries):
     print(f"\nProcessing Phase 1 Entry {entry_idx + 1}/{len(phase1entries)}")
     
     # Event Formalization via the Perception Layer.
-    events, eventid = encoder(client, entry, eventid + 1)   
+    events, eventid = encoder(client, entry, eventid + 1, sentences=phase1sentences[entry_idx], dedup=dedup)   
     
     for event in tqdm(events, desc=f"Processing Entry {entry_idx + 1} events"):
         # Affective Grounding (High Road) assigns a ground-truth emotional tag.
-        e_tag = emotional_tagging(client, event)
+        e_tag = dedup.perceive(
+            "tagger", event.get('Raw Text', ''),
+            lambda: emotional_tagging(client, event), {"Event ID": event.get("Event ID")}
+        )
         
+        recorder.record(1, event, e_tag)
         if e_tag is None:
             continue
             
@@ -77,7 +139,8 @@ for entry_idx, entry in enumerate(phase1entries):
         # Initial Social Modeling extracts entities to build relationship graphs.
         raw_text = event.get('Raw Text', '')
         if raw_text:
-            entities = extract_entities(client, raw_text)
+            entities = dedup.perceive("entities", raw_text, lambda: extract_entities(client, raw_text))
+            recorder.add_entities(entities)
             if entities:
                 attachment_model.process_event(
                     raw_text, 
@@ -86,6 +149,13 @@ for entry_idx, entry in enumerate(phase1entries):
                     e_tag['Emotion Intensity']
                 )
 
+if MEMORY_STORE_PATH is not None and not warm_start:
+    recorder.flush()
+    emotional_memory_stack.set_meta("last_event_id", eventid)
+    emotional_memory_stack.set_meta("attachment_graphs", list(attachment_model.edge_records()))
+    emotional_memory_stack.set_meta("phase1_recording", load_recording(REPLAY_RECORDING)[0])
+    emotional_memory_stack.snapshot(MEMORY_SEED_PATH)
+
 print(f"\nPhase 1 Complete!")
 print(f"Total memories stored: {len(emotional_memory_stack['Memory List'])}")
 strongest_attachments = attachment_model.get_strongest_attachments(5)
@@ -108,7 +178,7 @@ phase2_stats = {
 for entry_idx, entry in enumerate(phase2entries):
     print(f"\nProcessing Phase 2 Entry {entry_idx + 1}/{len(phase2entries)}")
     
-    events, eventid = encoder(client, entry, eventid + 1)
+    events, eventid = encoder(client, entry, eventid + 1, sentences=phase2sentences[entry_idx], dedup=dedup)
     
     for event in tqdm(events, desc=f"Learning from Entry {entry_idx + 1} events"):
         phase2_stats["total_events"] += 1
@@ -118,7 +188,11 @@ for entry_idx, entry in enumerate(phase2entries):
         phase2_stats["predictions_made"] += 1
         
         # High Road: Obtains the ground-truth emotional tag for the event.
-        actual = emotional_tagging(client, event)
+        actual = dedup.perceive(
+            "tagger", event.get('Raw Text', ''),
+            lambda: emotional_tagging(client, event), {"Event ID": event.get("Event ID")}
+        )
+        recorder.record(2, event, actual)
         
         if actual is None:
             continue
@@ -155,12 +229,17 @@ for entry_idx, entry in enumerate(phase2entries):
         # Dynamically updates social model based on the event's emotional tone.
         raw_text = event.get('Raw Text', '')
         if raw_text:
-            entities = extract_entities(client, raw_text)
+            entities = dedup.perceive("entities", raw_text, lambda: extract_entities(client, raw_text))
+            recorder.add_entities(entities)
             if entities:
                 attachment_model.process_event(
                     raw_text, entities, actual['Assigned Emotion'], actual['Emotion Intensity']
                 )
 
+recorder.close()
+if MEMORY_STORE_PATH is not None:
+    emotional_memory_stack.set_meta("last_event_id", eventid)
+
 print("\n" + "=" * 60)
 print("PHASE 2 COMPLETE - LEARNING STATISTICS")
 print("=" * 60)
@@ -172,26 +251,46 @@ print(f"Contradictions found: {phase2_stats['contradictions']}")
 print(f"Average prediction error: {avg_error:.3f}")
 print(f"Concepts with emotional shifts: {list(phase2_stats['shifted_concepts'])}")
 
+dedup_report = dedup.report()
+print(f"LLM calls avoided by deduplication: {dedup_report['llm_calls_avoided']} "
+      f"({dedup_report['exact_hits']} exact, {dedup_report['near_hits']} near) {dedup_report['by_stage']}")
+
+print("Structured output per stage:")
+for stage, counts in parse_failure_report().items():
+    print(f"  {stage}: {counts['calls']} calls, {counts['parse_failures']} parse failures, "
+          f"{counts['reasks']} re-asks ({counts['recovered']} recovered), {counts['unusable']} unusable")
+
+print("Response latency per stage:")
+for stage, timing in response_timing_report().items():
+    time_to_result = f"{timing['mean_time_to_result']:.2f}s" if timing['mean_time_to_result'] is not None else "n/a"
+    full_completion = f"{timing['mean_full_completion']:.2f}s" if timing['mean_full_completion'] is not None else "n/a"
+    saved = f"{timing['saved_per_call']:.2f}s" if timing['saved_per_call'] is not None else "n/a"
+    print(f"  {stage}: {timing['calls']} calls, {timing['early_stops']} early stops, "
+          f"time-to-result {time_to_result}, full completion {full_completion} "
+          f"({timing['sampled_full_completions']} sampled), saved/call {saved}, "
+          f"escalation rate {timing['escalation_rate']:.1%}")
+    for model, route in timing['routes'].items():
+        print(f"    {model}: {route['calls']} calls, {route['mean_latency']:.2f}s mean, {route['rejected']} rejected")
+
 print(f"\nFinal memory count: {len(emotional_memory_stack['Memory List'])}")
 final_attachments = attachment_model.get_strongest_attachments(10)
 print("Final strongest attachments:")
-for entity, weight in final_attachments:
-    attachment_data = attachment_model.get_attachment(entity)
+for entity, attachment_data in final_attachments:
     valence = attachment_data.get('valence', 'Unknown') if attachment_data else 'Unknown'
-    print(f"  {entity}: {weight:.3f} ({valence})")
+    print(f"  {entity}: {attachment_data['weight']:.3f} ({valence})")
+print("Strongest entity pairs:")
+for (entity_a, entity_b), edge in attachment_model.get_strongest_pairs(5):
+    print(f"  {entity_a} <-> {entity_b}: {edge['weight']:.3f}")
 
 print("\nSaving results...")
-with open("results/emotional_memory_stack.json", "w") as f:
-    json.dump(emotional_memory_stack, f, indent=2, default=str)
-with open("results/attachment_graphs.json", "w") as f:
-    json.dump({"attachment_graph": attachment_model.attachment_graph, "entity_graph": attachment_model.entity_graph, "emotional_graph": attachment_model.emotional_graph}, f, indent=2, default=str)
-with open("results/learning_stats.json", "w") as f:
-    json.dump({**phase2_stats, "shifted_concepts": list(phase2_stats["shifted_concepts"]), "average_error": avg_error}, f, indent=2, default=str)
-with open("results/bias.json", "w") as f:
-    json.dump(bias_meter, f, indent=2, default=str)
-with open("results/emotional_time.json", "w") as f:
-    json.dump(emotional_timeline, f, indent=2, default=str)
-with open("results/contradictionlog.json", "w") as f:
-    json.dump(contradiction_log, f, indent=2, default=str)
+# Results are streamed record-by-record; set RESULTS_FORMAT = "msgpack" for compact
+# binary memory stack, graph and timeline files (requires the msgpack package).
+writer = ResultsWriter("results", fmt=RESULTS_FORMAT)
+writer.write_memory_stack(emotional_memory_stack)
+writer.write_attachment_graphs(attachment_model)
+writer.write_learning_stats({**phase2_stats, "shifted_concepts": list(phase2_stats["shifted_concepts"]), "average_error": avg_error})
+writer.write_bias(bias_meter)
+writer.write_timeline(emotional_timeline)
+writer.write_contradictions(contradiction_log)
 
 print("Results saved to results/ directory.")
\ No newline at end of file
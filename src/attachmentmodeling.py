@@ -1,8 +1,42 @@
 # attachmentmodeling.py
 
+from collections import Counter
 from datetime import datetime
 from itertools import combinations
 import difflib
+import heapq
+
+
+# Ranks keys by descending absolute weight for top-k queries. Updates push a new
+# heap entry in O(log n) and leave the old one behind; top() discards entries whose
+# weight is out of date as it meets them, and the heap is rebuilt once stale
+# entries outnumber live keys, so no update ever touches the whole ranking.
+class RankedWeights:
+    def __init__(self):
+        self.weights = {}
+        self._heap = []  # (-abs(weight), key); may hold stale entries.
+
+    def update(self, key, weight):
+        self.weights[key] = weight
+        heapq.heappush(self._heap, (-abs(weight), key))
+        if len(self._heap) > 2 * len(self.weights) + 16:
+            self._heap = [(-abs(w), k) for k, w in self.weights.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, limit):
+        ranked, live = [], []
+        while self._heap and len(ranked) < limit:
+            entry = heapq.heappop(self._heap)
+            neg_weight, key = entry
+            if key in self.weights and -abs(self.weights[key]) == neg_weight and key not in ranked:
+                ranked.append(key)
+                live.append(entry)
+        for entry in live:
+            heapq.heappush(self._heap, entry)
+        return ranked
+
+    def __len__(self):
+        return len(self.weights)
 
 # Implements the Relationship Modeling module (RM), which constructs and maintains
 # [cite_start]the Attachment Graph (Anne-centric) and the inter-entity Relationship Graph[cite: 87, 99].
@@ -29,9 +63,14 @@ class AuthorityAttachmentModel:
     
     def __init__(self):
         self.attachment_graph = {"Anne Frank": {}}
+        # Sparse, symmetric adjacency: entity -> Counter of co-occurring entities.
         self.entity_graph = {}
-        self.emotional_graph = {} 
+        # Sparse, symmetric adjacency: entity -> entity -> {"weight", "emotions"}.
+        # Both directions share the same edge dictionary.
+        self.emotional_graph = {}
         self.similarity_threshold = 0.8
+        self._attachment_rank = RankedWeights()
+        self._pair_rank = RankedWeights()
         
     def normalize_entity(self, entity: str):
         entity_lower = entity.lower()
@@ -59,13 +98,71 @@ class AuthorityAttachmentModel:
             current = self.attachment_graph["Anne Frank"][entity]
             current["weight"] += weight_adjustment
             current["history"].append({"emotion": emotion, "adjustment": weight_adjustment})
+            self._attachment_rank.update(entity, current["weight"])
+
+        self.update_relationships(normalized_entities, emotion, weight_adjustment)
+
+    # Updates the inter-entity Relationship Graph for every pair of entities that
+    # co-occur in one event. Cost is quadratic in the entities of that event only.
+    def update_relationships(self, normalized_entities, emotion, weight_adjustment):
+        for a, b in combinations(sorted(e for e in normalized_entities if e), 2):
+            self.entity_graph.setdefault(a, Counter())[b] += 1
+            self.entity_graph.setdefault(b, Counter())[a] += 1
+
+            edge = self.emotional_graph.setdefault(a, {}).get(b)
+            if edge is None:
+                edge = {"weight": 0.0, "emotions": Counter()}
+                self.emotional_graph[a][b] = edge
+                self.emotional_graph.setdefault(b, {})[a] = edge
+            edge["weight"] += weight_adjustment
+            edge["emotions"][emotion] += 1
+            self._pair_rank.update((a, b), edge["weight"])
 
     def process_event(self, event_text, entities, emotion, intensity):
         self.update_attachment(entities, emotion, intensity, event_text)
 
     def get_strongest_attachments(self, limit=5):
-        attachments = self.attachment_graph["Anne Frank"].items()
-        return sorted(attachments, key=lambda item: abs(item[1]["weight"]), reverse=True)[:limit]
+        attachments = self.attachment_graph["Anne Frank"]
+        return [(entity, attachments[entity]) for entity in self._attachment_rank.top(limit)]
+
+    def get_strongest_pairs(self, limit=5):
+        return [((a, b), self.emotional_graph[a][b]) for a, b in self._pair_rank.top(limit)]
+
+    # Flattens all three graphs into one record per (source, target) edge; this is
+    # the layout ResultsWriter saves and from_edge_records reads back.
+    def edge_records(self):
+        graphs = {
+            "attachment_graph": self.attachment_graph,
+            "entity_graph": self.entity_graph,
+            "emotional_graph": self.emotional_graph,
+        }
+        for graph_name, graph in graphs.items():
+            for source, targets in graph.items():
+                for target, data in targets.items():
+                    yield {"graph": graph_name, "source": source, "target": target, "data": data}
+
+    # Rebuilds a model, including its rankings, from edge records such as
+    # iter_records("results/attachment_graphs.jsonl").
+    @classmethod
+    def from_edge_records(cls, records):
+        model = cls()
+        for record in records:
+            source, target, data = record["source"], record["target"], record["data"]
+            if record["graph"] == "attachment_graph":
+                model.attachment_graph.setdefault(source, {})[target] = data
+                if source == "Anne Frank":
+                    model._attachment_rank.update(target, data["weight"])
+            elif record["graph"] == "entity_graph":
+                model.entity_graph.setdefault(source, Counter())[target] = data
+            elif record["graph"] == "emotional_graph":
+                # Both directions are stored; they must share one edge dictionary again.
+                edge = model.emotional_graph.get(target, {}).get(source)
+                if edge is None:
+                    edge = {**data, "emotions": Counter(data.get("emotions", {}))}
+                model.emotional_graph.setdefault(source, {})[target] = edge
+                if source < target:
+                    model._pair_rank.update((source, target), edge["weight"])
+        return model
 
     def get_attachment(self, entity):
         return self.attachment_graph["Anne Frank"].get(self.normalize_entity(entity))
\ No newline at end of file
@@ -1,50 +1,171 @@
 import json
+import os
 import random
 from pathlib import Path
 
+from src.results_io import iter_records
 
-def load_bias_summary(bias_path="results/bias.json", contradiction_path="results/contradictionlog.json", concept=None, limit=5):
-    bias_path = Path(bias_path)
-    contradiction_path = Path(contradiction_path)
-
-    bias_summary = []
-    contradiction_summary = []
-    ambient_bias = []
-    ambient_contr = []
-
-    if bias_path.exists():
-        with open(bias_path) as f:
-            bias_data = json.load(f)
-
-        for c, emotion_map in bias_data.items():
-            if len(emotion_map) > 1:
-                sorted_emotions = sorted(emotion_map.items(), key=lambda x: -x[1])
-                path = " → ".join(e for e, _ in sorted_emotions)
-                item = f"- {c}: {path}"
-                if concept and concept.lower() in c.lower():
-                    bias_summary.append(item)
-                else:
-                    ambient_bias.append(item)
-
-    if contradiction_path.exists():
-        with open(contradiction_path) as f:
-            contradiction_data = json.load(f)
-
-        for entry in contradiction_data:
-            c = entry.get("concept")
-            prior = entry.get("prior_emotion")
-            new = entry.get("new_emotion")
-            if c and prior and new:
-                item = f"- {c}: {prior} → {new}"
-                if concept and concept.lower() in c.lower():
-                    contradiction_summary.append(item)
-                else:
-                    ambient_contr.append(item)
-
-    sampled_bias = random.sample(ambient_bias, min(2, len(ambient_bias)))
-    sampled_contr = random.sample(ambient_contr, min(1, len(ambient_contr)))
-
-    return bias_summary + sampled_bias, contradiction_summary + sampled_contr
+
+def _read_records(path):
+    # Accepts both the legacy indented JSON files and the streamed JSONL/msgpack results.
+    if path.suffix == ".json":
+        with open(path) as f:
+            return json.load(f)
+    return list(iter_records(path))
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class BiasStore:
+    """
+    Long-lived, indexed view over the bias meter and contradiction log files.
+
+    Files are parsed once and re-parsed only when their modification times change.
+    Concept names are indexed by character trigrams so substring queries only test
+    the handful of concepts that can possibly match, and each concept's emotion path
+    ("Fear → Sadness") is formatted once at load time rather than on every query.
+    """
+
+    NGRAM = 3
+
+    def __init__(self, bias_path="results/bias.jsonl", contradiction_path="results/contradictionlog.jsonl", seed=None):
+        self.bias_path = Path(bias_path)
+        self.contradiction_path = Path(contradiction_path)
+        self.rng = random.Random(seed)
+        self._mtimes = (None, None)
+        self._loaded = False
+        self.bias_items = []
+        self.contradiction_items = []
+
+    # --- Loading and indexing.
+
+    def refresh(self):
+        """Reloads the underlying files if either has changed since the last load."""
+        mtimes = (_mtime(self.bias_path), _mtime(self.contradiction_path))
+        if self._loaded and mtimes == self._mtimes:
+            return
+        self._load_bias()
+        self._load_contradictions()
+        self._mtimes = mtimes
+        self._loaded = True
+
+    def _load_bias(self):
+        self.bias_items = []
+        if self.bias_path.exists():
+            bias_data = _read_records(self.bias_path)
+            if isinstance(bias_data, list):
+                bias_data = {record["concept"]: record["emotions"] for record in bias_data}
+            for c, emotion_map in bias_data.items():
+                if len(emotion_map) > 1:
+                    sorted_emotions = sorted(emotion_map.items(), key=lambda x: -x[1])
+                    path = " → ".join(e for e, _ in sorted_emotions)
+                    self.bias_items.append((c, f"- {c}: {path}"))
+        self._bias_index = self._build_index(self.bias_items)
+
+    def _load_contradictions(self):
+        self.contradiction_items = []
+        if self.contradiction_path.exists():
+            for entry in _read_records(self.contradiction_path):
+                c = entry.get("concept")
+                prior = entry.get("prior_emotion")
+                new = entry.get("new_emotion")
+                if c and prior and new:
+                    self.contradiction_items.append((c, f"- {c}: {prior} → {new}"))
+        self._contradiction_index = self._build_index(self.contradiction_items)
+
+    def _build_index(self, items):
+        # Maps each lowercase concept name to the positions of its items, and each
+        # trigram to the set of concept names that contain it.
+        by_name = {}
+        for position, (c, _) in enumerate(items):
+            by_name.setdefault(c.lower(), []).append(position)
+        grams = {}
+        for name in by_name:
+            for i in range(len(name) - self.NGRAM + 1):
+                grams.setdefault(name[i:i + self.NGRAM], set()).add(name)
+        return by_name, grams
+
+    # --- Querying.
+
+    def _matching_positions(self, index, concept):
+        by_name, grams = index
+        query = concept.lower()
+        if len(query) < self.NGRAM:
+            candidates = by_name.keys()
+        else:
+            query_grams = {query[i:i + self.NGRAM] for i in range(len(query) - self.NGRAM + 1)}
+            postings = sorted((grams.get(g, set()) for g in query_grams), key=len)
+            candidates = set.intersection(*postings) if postings else set()
+        positions = []
+        for name in candidates:
+            if query in name:
+                positions.extend(by_name[name])
+        positions.sort()
+        return positions
+
+    def _sample_ambient(self, items, excluded, count):
+        # Samples from everything not matched by the query without materialising the
+        # (usually much larger) ambient list.
+        available = len(items) - len(excluded)
+        count = min(count, available)
+        if count <= 0:
+            return []
+        if available <= 4 * count:
+            ambient = [item for position, (_, item) in enumerate(items) if position not in excluded]
+            return self.rng.sample(ambient, count)
+        chosen = []
+        while len(chosen) < count:
+            position = self.rng.randrange(len(items))
+            if position not in excluded and position not in chosen:
+                chosen.append(position)
+        return [items[position][1] for position in chosen]
+
+    def _summarize(self, concept):
+        bias_matches = self._matching_positions(self._bias_index, concept) if concept else []
+        contr_matches = self._matching_positions(self._contradiction_index, concept) if concept else []
+
+        bias_summary = [self.bias_items[p][1] for p in bias_matches]
+        contradiction_summary = [self.contradiction_items[p][1] for p in contr_matches]
+
+        sampled_bias = self._sample_ambient(self.bias_items, set(bias_matches), 2)
+        sampled_contr = self._sample_ambient(self.contradiction_items, set(contr_matches), 1)
+
+        return bias_summary + sampled_bias, contradiction_summary + sampled_contr
+
+    def summary(self, concept=None):
+        """Returns (bias lines, contradiction lines) for a single concept query."""
+        self.refresh()
+        return self._summarize(concept)
+
+    def summaries(self, concepts):
+        """
+        Answers many concept queries in one pass over a single, freshly checked snapshot.
+
+        Returns:
+            dict: Maps each concept to its (bias lines, contradiction lines) tuple.
+        """
+        self.refresh()
+        return {concept: self._summarize(concept) for concept in concepts}
+
+
+# Stores shared by load_bias_summary, keyed by the file paths they serve.
+_stores = {}
+
+
+def get_bias_store(bias_path="results/bias.jsonl", contradiction_path="results/contradictionlog.jsonl"):
+    key = (str(bias_path), str(contradiction_path))
+    if key not in _stores:
+        _stores[key] = BiasStore(bias_path, contradiction_path)
+    return _stores[key]
+
+
+def load_bias_summary(bias_path="results/bias.jsonl", contradiction_path="results/contradictionlog.jsonl", concept=None, limit=5):
+    return get_bias_store(bias_path, contradiction_path).summary(concept)
 
 
 # # Example usage:
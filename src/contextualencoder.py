@@ -1,25 +1,39 @@
 from openai import OpenAI
-import re
-import json
 import spacy
-from src.helper import get_response
+from src.structured_output import structured_response
 from tqdm import tqdm
 
-nlp = spacy.load("en_core_web_sm")
+# Sentence-boundary-only pipeline used for batch segmentation; loaded on first use.
+sentence_nlp = None
 
 def split_into_sentences(text):
-    doc = nlp(text)
-    return [sent.text.strip() for sent in doc.sents]
+    return split_entries_into_sentences([text])[0]
 
-def extract_json(text):
-    """Safely extract JSON from the model output."""
-    try:
-        json_text = re.search(r'\{.*\}', text, re.DOTALL).group()
-        return json.loads(json_text)
-    except Exception as e:
-        print(f"Error extracting JSON: {e}")
-        print("Raw output:", text)
-        return None
+def get_sentence_nlp():
+    """Loads en_core_web_sm with only the statistical sentence recognizer (senter) enabled."""
+    global sentence_nlp
+    if sentence_nlp is None:
+        sentence_nlp = spacy.load(
+            "en_core_web_sm",
+            exclude=["tok2vec", "parser", "tagger", "attribute_ruler", "lemmatizer", "ner"]
+        )
+        sentence_nlp.enable_pipe("senter")
+    return sentence_nlp
+
+def split_entries_into_sentences(texts, batch_size=64, n_process=1):
+    """
+    Segments many entries in one pass using nlp.pipe over a senter-only pipeline.
+
+    Args:
+        texts: Entry strings to segment.
+        batch_size (int): Number of texts buffered per spaCy batch.
+        n_process (int): Worker processes for nlp.pipe (-1 uses all CPUs).
+
+    Returns:
+        list: One list of sentence strings per input text, in input order.
+    """
+    docs = get_sentence_nlp().pipe(texts, batch_size=batch_size, n_process=n_process)
+    return [[sent.text.strip() for sent in doc.sents] for doc in docs]
 
 def process_sentence(client,sentence, event_id):
     prompt = f"""
@@ -47,17 +61,26 @@ def process_sentence(client,sentence, event_id):
     Respond ONLY with valid JSON.
     """
 
-    response = get_response(client,prompt)
-    return extract_json(response)
+    return structured_response(client, "encoder", prompt)
 
-def encoder(client_instance, te, event_id_start=0): # Renamed event_id to event_id_start for clarity
-    sentences = split_into_sentences(te)
+def encoder(client_instance, te, event_id_start=0, sentences=None, dedup=None): # Renamed event_id to event_id_start for clarity
+    # Sentences may be pre-segmented with split_entries_into_sentences.
+    if sentences is None:
+        sentences = split_into_sentences(te)
     events = []
     # Wrap enumerate with tqdm for a progress bar
     for idx, sentence in tqdm(enumerate(sentences, start=event_id_start), 
                               total=len(sentences), 
                               desc="Processing Sentences"):
-        event = process_sentence(client_instance, sentence, idx) # Pass client_instance
+        if dedup is not None:
+            # Near-duplicate sentences reuse an earlier event under their own ID and text.
+            event = dedup.perceive(
+                "encoder", sentence,
+                lambda: process_sentence(client_instance, sentence, idx),
+                {"Event ID": f"event_{idx}", "Raw Text": sentence}
+            )
+        else:
+            event = process_sentence(client_instance, sentence, idx) # Pass client_instance
         if event:
             events.append(event)
         # event_id = idx # This line is not needed if you return events and the last idx
@@ -0,0 +1,141 @@
+# dedup.py
+
+# Near-duplicate detection for sentences entering the perception stages. Diaries
+# repeat greetings, sign-offs and near-identical sentences; recognising them lets
+# the encoder, tagger and entity extractor reuse earlier LLM results instead of
+# paying for another call.
+
+from typing import Callable, Dict, Optional
+import copy
+import hashlib
+import re
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases text and reduces it to space-separated word tokens."""
+    return " ".join(_TOKEN_PATTERN.findall(text.lower()))
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(tokens, bits: int = 64) -> int:
+    """
+    Computes a SimHash fingerprint over word unigrams and bigrams.
+
+    Texts that share most of their tokens produce fingerprints that differ in only
+    a few bits, so the Hamming distance between fingerprints approximates how
+    different the texts are.
+    """
+    features = list(tokens) + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    counts = [0] * bits
+    for feature in features:
+        h = _hash64(feature)
+        for bit in range(bits):
+            counts[bit] += 1 if (h >> bit) & 1 else -1
+    fingerprint = 0
+    for bit in range(bits):
+        if counts[bit] > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class PerceptionDeduplicator:
+    """
+    Caches perception-stage results per sentence and serves them for repeats.
+
+    A sentence matches an earlier one when their normalized text is identical, or
+    when their SimHash fingerprints differ in at most `threshold` bits. Fingerprints
+    are split into `threshold + 1` bands; by the pigeonhole principle any match
+    shares at least one band exactly, so lookups only compare against sentences in
+    the same band buckets.
+    """
+
+    BITS = 64
+
+    def __init__(self, threshold: int = 8, min_tokens: int = 4):
+        self.threshold = threshold
+        # Short texts ("Yours, Anne.") only deduplicate on exact normalized matches.
+        self.min_tokens = min_tokens
+        self.bands = threshold + 1
+        # Band boundaries partition all BITS bits as evenly as possible (widths differ by at most one).
+        self._band_edges = [band * self.BITS // self.bands for band in range(self.bands + 1)]
+        self.exact = {}           # normalized text hash -> canonical id
+        self.fingerprints = []    # canonical id -> fingerprint
+        self.buckets = {}         # (band, band value) -> [canonical id]
+        self.results = {}         # (stage, canonical id) -> result
+        self._last_match = None
+        self.stats = {"lookups": 0, "exact_hits": 0, "near_hits": 0, "llm_calls_avoided": 0, "by_stage": {}}
+
+    def _bands(self, fingerprint: int):
+        for band in range(self.bands):
+            low, high = self._band_edges[band], self._band_edges[band + 1]
+            yield band, (fingerprint >> low) & ((1 << (high - low)) - 1)
+
+    def canonical_id(self, text: str) -> int:
+        """Returns the id of the earlier matching sentence, registering `text` as new if none matches."""
+        normalized = normalize_text(text)
+        key = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+        if key in self.exact:
+            self._last_match = "exact"
+            return self.exact[key]
+
+        tokens = normalized.split()
+        fingerprint = simhash(tokens, self.BITS)
+        if len(tokens) >= self.min_tokens:
+            for band_key in self._bands(fingerprint):
+                for candidate in self.buckets.get(band_key, []):
+                    if bin(fingerprint ^ self.fingerprints[candidate]).count("1") <= self.threshold:
+                        self.exact[key] = candidate
+                        self._last_match = "near"
+                        return candidate
+
+        canonical = len(self.fingerprints)
+        self.fingerprints.append(fingerprint)
+        self.exact[key] = canonical
+        if len(tokens) >= self.min_tokens:
+            for band_key in self._bands(fingerprint):
+                self.buckets.setdefault(band_key, []).append(canonical)
+        self._last_match = None
+        return canonical
+
+    def lookup(self, stage: str, text: str, overrides: Optional[Dict] = None):
+        """Returns a copy of a cached result for `text` (or a near duplicate), or None on a miss."""
+        self.stats["lookups"] += 1
+        if not normalize_text(text):
+            return None
+        canonical = self.canonical_id(text)
+        cached = self.results.get((stage, canonical))
+        if cached is None:
+            return None
+        self.stats["exact_hits" if self._last_match == "exact" else "near_hits"] += 1
+        self.stats["llm_calls_avoided"] += 1
+        self.stats["by_stage"][stage] = self.stats["by_stage"].get(stage, 0) + 1
+        result = copy.deepcopy(cached)
+        if isinstance(result, dict) and overrides:
+            result.update(overrides)
+        return result
+
+    def store(self, stage: str, text: str, result):
+        """Caches `result` for `text`. Results of None (failed parses) are never cached."""
+        if result is not None and normalize_text(text):
+            self.results[(stage, self.canonical_id(text))] = copy.deepcopy(result)
+
+    def perceive(self, stage: str, text: str, compute: Callable[[], object], overrides: Optional[Dict] = None):
+        """
+        Returns the result of `compute()` for `text`, reusing a near-duplicate's result when one exists.
+
+        Reused results are deep-copied, and dictionary results have `overrides`
+        (e.g. the new Event ID) applied.
+        """
+        result = self.lookup(stage, text, overrides)
+        if result is None:
+            result = compute()
+            self.store(stage, text, result)
+        return result
+
+    def report(self) -> Dict:
+        return {**self.stats, "unique_sentences": len(self.fingerprints)}
@@ -1,6 +1,5 @@
-from src.helper import get_response
+from src.structured_output import structured_response
 import json
-import re
 
 def create_emotional_tagging_prompt(event):
     prompt = f"""
@@ -29,50 +28,13 @@ def create_emotional_tagging_prompt(event):
     """
     return prompt
 
-def process_emotion_response(response_text):
-    # Strip any explanatory text before or after the JSON
-    json_match = re.search(r'\{[^{]*"Event ID"[^}]*\}', response_text)
-    if not json_match:
-        return None
-    
-    json_str = json_match.group(0)
-    
-    try:
-        # Parse the JSON
-        data = json.loads(json_str)
-        
-        # Validate Event ID exists
-        if "Event ID" not in data:
-            raise ValueError("Missing Event ID")
-            
-        # Validate emotion is in allowed list
-        allowed_emotions = ["Joy", "Sadness", "Fear", "Anger", "Curiosity", "Love/Attachment"]
-        if data.get("Assigned Emotion") not in allowed_emotions:
-            # Replace with closest match or default
-            data["Assigned Emotion"] = "Curiosity"  # Default fallback
-            
-        # Validate intensity is numeric and in range
-        intensity = data.get("Emotion Intensity")
-        if not isinstance(intensity, (int, float)) or intensity < 0 or intensity > 1:
-            data["Emotion Intensity"] = 0.5  # Default fallback
-            
-        return data
-    except json.JSONDecodeError:
-        return None
-    
 def emotional_tagging(client,event):
     prompt = create_emotional_tagging_prompt(event)
-    response = get_response(client,prompt)  # Your function to call the model
-    
-    # Process and validate the response
-    emotion_data = process_emotion_response(response)
+    emotion_data = structured_response(client, "tagger", prompt)
     
-    if not emotion_data:
-        # Fallback for completely invalid responses
-        emotion_data = {
-            "Event ID": event["Event ID"],
-            "Assigned Emotion": "Curiosity",  # Default emotion
-            "Emotion Intensity": 0.5  # Default intensity
-        }
+    if emotion_data is None:
+        # Unusable even after a re-ask; callers skip the event instead of learning from a made-up tag.
+        return None
     
-    return emotion_data
\ No newline at end of file
+    emotion_data["Event ID"] = event["Event ID"]
+    return emotion_data
@@ -1,13 +1,12 @@
-from src.helper import get_response
+from src.structured_output import structured_response
 import spacy
 
-# Load spaCy English model
-nlp = spacy.load("en_core_web_sm")
+# Load spaCy English model; filtering needs only part-of-speech tags and stopwords.
+nlp = spacy.load("en_core_web_sm", exclude=["parser", "lemmatizer", "ner"])
 
 def filter_entities(entity_list):
     filtered = []
-    for ent in entity_list:
-        doc = nlp(ent)
+    for ent, doc in zip(entity_list, nlp.pipe(entity_list)):
         # Filter out if all tokens are stopwords, pronouns, conjunctions, etc.
         if all(token.pos_ in {"PRON", "CCONJ", "DET", "SCONJ"} or token.is_stop for token in doc):
             continue
@@ -38,30 +37,10 @@ def extract_entities(client,text):
     Example output:
     ["Father", "Margot", "diary", "attic", "doorbell rang"]
     """
-    response = get_response(client,prompt)
+    entities_list = structured_response(client, "entities", prompt)
     
-    # Parse the response string into a proper Python list
-    try:
-        # Try to safely evaluate the response as a Python expression
-        import ast
-        entities_list = ast.literal_eval(response.strip())
-        
-        # Ensure it's a list
-        if not isinstance(entities_list, list):
-            # If not a list, try to extract list from string
-            import re
-            matches = re.findall(r'\["(.+?)"\]', response.replace("'", '"'))
-            if matches:
-                entities_list = matches[0].split('", "')
-            else:
-                # Fallback: split by commas if enclosed in brackets
-                cleaned = response.strip().strip('[]')
-                entities_list = [item.strip().strip('"\'') for item in cleaned.split(',')]
-        
-        return entities_list
-    except:
-        # Fallback method if parsing fails
-        # Remove brackets, split by commas, and clean up each item
-        cleaned_response = response.strip().strip('[]')
-        entities = [item.strip().strip('"\'') for item in cleaned_response.split(',')]
-        return filter_entities(entities)
+    # Unusable output is counted by the structured-output layer; no entities are guessed.
+    if entities_list is None:
+        return []
+    # Schema-valid lists can still contain bare pronouns or stopwords ("she", "it").
+    return filter_entities(entities_list)
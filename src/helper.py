@@ -1,7 +1,13 @@
-from openai import OpenAI
-from typing import Dict
+from openai import BadRequestError, OpenAI
+from typing import Callable, Dict, Union
 from datetime import datetime
+import ast
+import json
+import os
+import random
 import re
+import threading
+import time
 
 def llm() -> OpenAI:
     """
@@ -15,36 +21,362 @@ def llm() -> OpenAI:
         OpenAI: An authenticated client object ready to make API calls.
     """
     client = OpenAI(
-        base_url="https://integrate.api.nvidia.com/v1",
-        api_key="NVIDIA_NIM_API_KEY" # Replace with your actual API key.
+        # Any OpenAI-compatible endpoint (including a local server) can be used via the environment.
+        base_url=os.environ.get("YGGDRASIL_BASE_URL", "https://integrate.api.nvidia.com/v1"),
+        api_key=os.environ.get("YGGDRASIL_API_KEY", "NVIDIA_NIM_API_KEY") # Replace with your actual API key.
     )
     return client
 
-def get_response(client: OpenAI, prompt: str) -> str:
+# --- Streaming is used by default: the stream is cancelled as soon as the first
+# complete JSON object or array has arrived.
+STREAM_RESPONSES = True
+
+# --- Opt-in: share of early-stopped streams that are read to the end on a background
+# thread so the latency report can compare time-to-result with the full completion
+# time of the same requests. Sampled streams are not cancelled, so their remaining
+# tokens are paid for, and samples still in flight at exit are lost. To measure
+# savings without this, compare against a run with STREAM_RESPONSES = False.
+FULL_COMPLETION_SAMPLE_RATE = 0.0
+
+# --- Sampling settings shared by every route unless a tier overrides them.
+DEFAULT_ROUTE = {
+    "model": "meta/llama-3.3-70b-instruct",
+    "temperature": 0.2, # Lower temperature for more deterministic, less creative output.
+    "top_p": 0.7,       # Nucleus sampling to control diversity.
+    "max_tokens": 4096,
+    # Ask for schema-constrained JSON ("json_schema"), plain JSON mode ("json_object")
+    # or neither (None) when the caller supplies a schema.
+    "structured_output": "json_schema",
+}
+
+# --- Per-stage model routing. Each stage lists tiers that are tried in order: a
+# tier's output is kept when it passes the caller's validation (or its confidence
+# reaches "min_confidence"), otherwise the call escalates to the next tier. The last
+# tier's output is always kept. A tier may set "base_url"/"api_key" to target a
+# different OpenAI-compatible endpoint, such as a local server.
+MODEL_ROUTES = {
+    "encoder": [
+        {"model": "meta/llama-3.1-8b-instruct", "max_tokens": 512},
+        {"model": "meta/llama-3.3-70b-instruct", "max_tokens": 512},
+    ],
+    # High Road tags are the learning signal, so tagging stays on the large model.
+    "tagger": [
+        {"model": "meta/llama-3.3-70b-instruct", "max_tokens": 96},
+    ],
+    "entities": [
+        {"model": "meta/llama-3.1-8b-instruct", "max_tokens": 256, "temperature": 0.0},
+        {"model": "meta/llama-3.3-70b-instruct", "max_tokens": 256},
+    ],
+}
+
+# --- Clients for tiers that point at their own endpoint, keyed by (base_url, api_key).
+_route_clients = {}
+
+# --- (base_url, model) pairs whose endpoint rejected response_format; later calls skip it.
+_unsupported_response_format = set()
+
+# --- Per-stage latency bookkeeping, summarised by response_timing_report().
+response_timings = {}
+
+# --- Guards the module-level state above; get_response may run on many threads (see service.py).
+_state_lock = threading.Lock()
+
+def decode_json_span(span: str):
+    """
+    Decodes one JSON object or array, accepting Python-style literals (single quotes) as a fallback.
+
+    Raises:
+        ValueError: If the span is neither valid JSON nor a Python literal.
+    """
+    try:
+        return json.loads(span)
+    except json.JSONDecodeError as e:
+        try:
+            return ast.literal_eval(span)
+        except (ValueError, SyntaxError):
+            raise ValueError(f"invalid JSON: {e}") from None
+
+class JSONCloseScanner:
+    """
+    Incrementally scans text for the end of the first complete, decodable JSON object or array.
+
+    Brackets inside string literals (including escaped quotes) are ignored, so the
+    scanner can be fed arbitrary chunks of a streamed completion. `root` ("object" or
+    "array") restricts which bracket may open the value. A closed span that does not
+    decode, such as "[note]" in a prose preamble, is skipped and scanning resumes just
+    after its opening bracket.
+    """
+
+    _OPENERS = {"object": "{", "array": "[", None: "{["}
+
+    def __init__(self, root: str = None):
+        self.text = ""
+        self.start = None
+        self.end = None
+        self._openers = self._OPENERS[root]
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str):
+        """Appends a chunk and returns the end offset (exclusive) once a value closes, else None."""
+        self.text += chunk
+        while self.end is None and self._pos < len(self.text):
+            i = self._pos
+            ch = self.text[i]
+            self._pos += 1
+            if self.start is None:
+                if ch in self._openers:
+                    self.start = i
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        decode_json_span(self.text[self.start:i + 1])
+                    except ValueError:
+                        self._pos = self.start + 1
+                        self.start = None
+                        continue
+                    self.end = i + 1
+        return self.end
+
+def _stage_stats(stage: str) -> Dict:
+    return response_timings.setdefault(stage or "default", {
+        "calls": 0, "early_stops": 0, "streamed_time": 0.0, "streamed_calls": 0, "full_time": 0.0, "full_calls": 0,
+        "sampled_calls": 0, "sampled_full_time": 0.0, "sampled_saved_time": 0.0, "escalations": 0, "routes": {}
+    })
+
+def _record_timing(stage: str, elapsed: float, streamed: bool, early_stop: bool = False):
+    with _state_lock:
+        stats = _stage_stats(stage)
+        stats["calls"] += 1
+        if streamed:
+            stats["streamed_calls"] += 1
+            stats["streamed_time"] += elapsed
+            stats["early_stops"] += int(early_stop)
+        else:
+            stats["full_calls"] += 1
+            stats["full_time"] += elapsed
+
+def _record_route(stage: str, model: str, elapsed: float, accepted: bool):
+    with _state_lock:
+        stats = _stage_stats(stage)
+        route = stats["routes"].setdefault(model, {"calls": 0, "time": 0.0, "rejected": 0})
+        route["calls"] += 1
+        route["time"] += elapsed
+        route["rejected"] += int(not accepted)
+        # A tier whose output was not kept means the call moved on to the next tier.
+        stats["escalations"] += int(not accepted)
+
+def _record_full_sample(stage: str, time_to_result: float, full_time: float):
+    with _state_lock:
+        stats = _stage_stats(stage)
+        stats["sampled_calls"] += 1
+        stats["sampled_full_time"] += full_time
+        stats["sampled_saved_time"] += full_time - time_to_result
+
+def _drain_and_time(response, stage: str, started: float, time_to_result: float):
+    # Reads an early-stopped stream to the end so its full completion time can be recorded.
+    try:
+        for _ in response:
+            pass
+        _record_full_sample(stage, time_to_result, time.perf_counter() - started)
+    except Exception as e:
+        print(f"[⚠️] Could not time full completion for stage '{stage}': {e}")
+    finally:
+        response.close()
+
+def _client_for(client: OpenAI, route: Dict) -> OpenAI:
+    if "base_url" not in route:
+        return client
+    key = (route["base_url"], route.get("api_key", "not-needed"))
+    with _state_lock:
+        if key not in _route_clients:
+            _route_clients[key] = OpenAI(base_url=key[0], api_key=key[1])
+        return _route_clients[key]
+
+def _response_format(route: Dict, schema: Dict):
+    if schema is None or route.get("structured_output") is None:
+        return None
+    with _state_lock:
+        if (route.get("base_url"), route["model"]) in _unsupported_response_format:
+            return None
+    if route["structured_output"] == "json_object":
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": schema.get("title", "response"), "schema": schema}}
+
+def _complete(client: OpenAI, prompt: str, route: Dict, stream: bool, schema: Dict = None, stage: str = None,
+              json_root: str = None):
+    """Runs one completion for a resolved route and returns (text, stopped_early)."""
+    started = time.perf_counter()
+    request = dict(
+        model=route["model"],
+        messages=[{"role": "user", "content": prompt}],
+        temperature=route["temperature"],
+        top_p=route["top_p"],
+        max_tokens=route["max_tokens"],
+        stream=stream
+    )
+    response_format = _response_format(route, schema)
+    route_client = _client_for(client, route)
+    if response_format is None:
+        response = route_client.chat.completions.create(**request)
+    else:
+        try:
+            response = route_client.chat.completions.create(response_format=response_format, **request)
+        except BadRequestError as e:
+            # Endpoints without structured output support reject the request with a 400;
+            # fall back to plain text. Other errors (rate limits, timeouts) propagate.
+            print(f"[⚠️] {route['model']} rejected response_format, continuing without it: {e}")
+            with _state_lock:
+                _unsupported_response_format.add((route.get("base_url"), route["model"]))
+            response = route_client.chat.completions.create(**request)
+    if not stream:
+        return response.choices[0].message.content, False
+
+    scanner = JSONCloseScanner(json_root)
+    end = None
+    drain = False
+    try:
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            end = scanner.feed(chunk.choices[0].delta.content or "")
+            if end is not None:
+                drain = random.random() < FULL_COMPLETION_SAMPLE_RATE
+                break
+    finally:
+        if drain:
+            # The result is returned now; the rest of the stream is read on a background thread.
+            threading.Thread(target=_drain_and_time, args=(response, stage, started, time.perf_counter() - started),
+                             daemon=True).start()
+        else:
+            response.close()  # Cancels the remaining generation when stopping early.
+    # Only the completed JSON value is returned; any preamble is dropped with the tail.
+    if end is not None:
+        return scanner.text[scanner.start:end], True
+    return scanner.text, False
+
+def get_response(client: OpenAI, prompt: str, stage: str = None, max_tokens: int = None, stream: bool = None,
+                 validate: Callable[[str], Union[bool, float]] = None, schema: Dict = None, json_root: str = None) -> str:
     """
-    Sends a prompt to the specified LLM and returns the content of its response.
+    Sends a prompt to the LLM routed for its stage and returns the content of its response.
 
-    This is a wrapper function for the chat completions API call, standardizing the
-    model parameters (e.g., model name, temperature, top_p) for consistent
-    behavior.
+    This is a wrapper function for the chat completions API call. Model, sampling
+    settings and token limit come from the stage's MODEL_ROUTES tiers. When a
+    validator is given, a cheap first tier is tried and the call escalates to the
+    next tier whenever validation fails or reports low confidence; without one, only
+    the final tier is used. In streaming mode, reading stops and the stream is closed
+    as soon as the first complete JSON object or array has been received.
 
     Args:
         client (OpenAI): The initialized API client.
         prompt (str): The user prompt to send to the model.
+        stage (str): Call site name ("encoder", "tagger", "entities") used for routing and timing.
+        max_tokens (int): Overrides the routed token limit.
+        stream (bool): Overrides STREAM_RESPONSES for this call.
+        validate (Callable): Returns True/False, or a confidence in [0, 1], for a response text.
+        schema (Dict): JSON schema requested via response_format on routes that enable structured output.
+        json_root (str): "object" or "array" if only that kind of value may end a streamed response.
 
     Returns:
         str: The textual content of the model's message.
     """
-    response = client.chat.completions.create(
-        model="meta/llama-3.3-70b-instruct",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2, # Lower temperature for more deterministic, less creative output.
-        top_p=0.7,       # Nucleus sampling to control diversity.
-        max_tokens=4096
-    )
-    return response.choices[0].message.content
+    if stream is None:
+        stream = STREAM_RESPONSES
+    tiers = MODEL_ROUTES.get(stage) or [{}]
+    if validate is None:
+        tiers = tiers[-1:]  # Nothing can judge a cheap tier's output, so go straight to the last one.
+
+    started = time.perf_counter()
+    early_stop = False
+    for position, tier in enumerate(tiers):
+        route = {**DEFAULT_ROUTE, **tier}
+        if max_tokens is not None:
+            route["max_tokens"] = max_tokens
+        is_last = position == len(tiers) - 1
+
+        tier_started = time.perf_counter()
+        try:
+            text, early_stop = _complete(client, prompt, route, stream, schema, stage, json_root)
+        except Exception as e:
+            if is_last:
+                raise
+            print(f"[⚠️] {route['model']} failed for stage '{stage}', escalating: {e}")
+            _record_route(stage, route["model"], time.perf_counter() - tier_started, accepted=False)
+            continue
+
+        accepted = True
+        if not is_last:
+            verdict = validate(text)
+            if isinstance(verdict, bool):
+                accepted = verdict
+            else:
+                accepted = verdict >= route.get("min_confidence", 0.5)
+        _record_route(stage, route["model"], time.perf_counter() - tier_started, accepted)
+        if accepted:
+            break
+
+    _record_timing(stage, time.perf_counter() - started, streamed=stream, early_stop=early_stop)
+    return text
+
+def response_timing_report() -> Dict:
+    """
+    Summarises per-stage response latency and model routing.
+
+    "saved_per_call" is measured on the same requests: a sample of early-stopped
+    streams (FULL_COMPLETION_SAMPLE_RATE) is drained to the end, and the mean time
+    between the result and the end of the stream is scaled by the early-stop rate.
+    Without samples it falls back to comparing streamed calls with non-streamed ones.
+    "escalation_rate" is the share of calls that needed more than one tier, and
+    "routes" gives each model's call count, mean latency and rejected outputs.
+
+    Returns:
+        Dict: Maps each stage to its call counts, escalations and mean latencies (seconds).
+    """
+    with _state_lock:
+        snapshot = {stage: {**stats, "routes": {m: dict(r) for m, r in stats["routes"].items()}}
+                    for stage, stats in response_timings.items()}
+    report = {}
+    for stage, stats in snapshot.items():
+        mean_streamed = stats["streamed_time"] / stats["streamed_calls"] if stats["streamed_calls"] else None
+        mean_full = stats["full_time"] / stats["full_calls"] if stats["full_calls"] else None
+        saved = mean_full - mean_streamed if mean_streamed is not None and mean_full is not None else None
+        if stats["sampled_calls"]:
+            early_stop_rate = stats["early_stops"] / stats["streamed_calls"]
+            saved = stats["sampled_saved_time"] / stats["sampled_calls"] * early_stop_rate
+            if mean_full is None:
+                mean_full = stats["sampled_full_time"] / stats["sampled_calls"]
+        report[stage] = {
+            "calls": stats["calls"],
+            "early_stops": stats["early_stops"],
+            "sampled_full_completions": stats["sampled_calls"],
+            "mean_time_to_result": mean_streamed,
+            "mean_full_completion": mean_full,
+            "saved_per_call": saved,
+            "escalation_rate": stats["escalations"] / stats["calls"] if stats["calls"] else 0.0,
+            "routes": {
+                model: {"calls": route["calls"], "mean_latency": route["time"] / route["calls"], "rejected": route["rejected"]}
+                for model, route in stats["routes"].items()
+            },
+        }
+    return report
 
-def compute_similarity(event_a: Dict, event_b: Dict) -> float:
+def compute_similarity(event_a: Dict, event_b: Dict, social_bonus: float = 0.5, temporal_bonus: float = 0.5) -> float:
     """
     Calculates a similarity score between two structured event dictionaries.
 
@@ -56,6 +388,8 @@ def compute_similarity(event_a: Dict, event_b: Dict) -> float:
     Args:
         event_a (Dict): The first event dictionary.
         event_b (Dict): The second event dictionary.
+        social_bonus (float): Score added for matching Social Context.
+        temporal_bonus (float): Score added for matching Temporal Context.
 
     Returns:
         float: A similarity score, capped at 1.0.
@@ -72,11 +406,11 @@ def compute_similarity(event_a: Dict, event_b: Dict) -> float:
 
     # Add a fixed bonus for matching Social Context.
     if event_a.get("Social Context") and event_a["Social Context"] == event_b.get("Social Context"):
-        score += 0.5
+        score += social_bonus
 
     # Add a fixed bonus for matching Temporal Context.
     if event_a.get("Temporal Context") and event_a["Temporal Context"] == event_b.get("Temporal Context"):
-        score += 0.5
+        score += temporal_bonus
 
     # Cap the total score at 1.0 to maintain a normalized range.
     return min(score, 1.0)
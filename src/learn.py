@@ -1,20 +1,29 @@
 from src.helper import compute_similarity
+from src.memory_storage import SQLiteMemoryStack
 from typing import Dict, List, Tuple
 import heapq
 import uuid
 from datetime import datetime 
 
 
-def predict_emotion(emotional_memory_stack,new_event: Dict, k: int = 5) -> Dict:
-    memory_list = emotional_memory_stack["Memory List"]
+def candidate_memories(emotional_memory_stack, new_event: Dict):
+    # Disk-backed stacks narrow retrieval with their indexes; in-memory stacks are scanned.
+    if isinstance(emotional_memory_stack, SQLiteMemoryStack):
+        return emotional_memory_stack.candidate_memories(new_event)
+    return emotional_memory_stack["Memory List"]
+
+
+def predict_emotion(emotional_memory_stack,new_event: Dict, k: int = 5, social_bonus: float = 0.5, temporal_bonus: float = 0.5) -> Dict:
+    memory_list = candidate_memories(emotional_memory_stack, new_event)
     similarity_heap: List[Tuple[float, str, Dict]] = []
 
-    for memory in memory_list:
-        similarity = compute_similarity(new_event, memory)
+    for position, memory in enumerate(memory_list):
+        similarity = compute_similarity(new_event, memory, social_bonus, temporal_bonus)
         if similarity > 0:
-            heapq.heappush(similarity_heap, (-similarity, memory["Event ID"], memory))  # use ID to break ties
+            # Use ID, then storage order, to break ties so memories themselves are never compared.
+            heapq.heappush(similarity_heap, (-similarity, memory["Event ID"], position, memory))
 
-    top_k = [heapq.heappop(similarity_heap)[2] for _ in range(min(k, len(similarity_heap)))]
+    top_k = [heapq.heappop(similarity_heap)[3] for _ in range(min(k, len(similarity_heap)))]
 
     if not top_k:
         return {
@@ -30,7 +39,7 @@ def predict_emotion(emotional_memory_stack,new_event: Dict, k: int = 5) -> Dict:
     for mem in top_k:
         emotion = mem["Assigned Emotion"]
         intensity = mem["Emotion Intensity"]
-        sim = compute_similarity(new_event, mem)
+        sim = compute_similarity(new_event, mem, social_bonus, temporal_bonus)
 
         emotion_scores[emotion] = emotion_scores.get(emotion, 0) + sim * intensity
         total_weight += sim
@@ -68,14 +77,17 @@ def update_bias_meter(bias_meter,emotional_timeline,event):
     })
 
 
-def learn_from_emotional_error(bias_meter,emotional_timeline,contradiction_log,emotional_memory_stack,new_event: Dict, predicted: Dict, actual: Dict, error_thresholds=(0.2, 0.5)) -> Dict:
+def learn_from_emotional_error(bias_meter,emotional_timeline,contradiction_log,emotional_memory_stack,new_event: Dict, predicted: Dict, actual: Dict, error_thresholds=(0.2, 0.5), reinforce_step=0.05, penalty_step=0.2, social_bonus=0.5, temporal_bonus=0.5, new_event_id=None) -> Dict:
+    # new_event_id mints IDs for contradiction memories; replays pass a deterministic factory.
+    if new_event_id is None:
+        new_event_id = lambda: f"event_{uuid.uuid4().hex[:6]}"
     error = abs(predicted["Predicted Intensity"] - actual["Emotion Intensity"])
     match = predicted["Predicted Emotion"] == actual["Assigned Emotion"]
-    memory_list = emotional_memory_stack["Memory List"]
+    memory_list = candidate_memories(emotional_memory_stack, new_event)
 
     similar_memories = []
     for mem in memory_list:
-        sim = compute_similarity(new_event, mem)
+        sim = compute_similarity(new_event, mem, social_bonus, temporal_bonus)
         if sim > 0:
             similar_memories.append((sim, mem))
 
@@ -89,7 +101,7 @@ def learn_from_emotional_error(bias_meter,emotional_timeline,contradiction_log,e
     if error < error_thresholds[0]:  # 🔧 Small error — reinforce
         for mem in top_supporting:
             if mem["Assigned Emotion"] == predicted["Predicted Emotion"]:
-                mem["Emotion Intensity"] = round(min(mem["Emotion Intensity"] + 0.05, 1.0), 2)
+                mem["Emotion Intensity"] = round(min(mem["Emotion Intensity"] + reinforce_step, 1.0), 2)
                 updates.append(mem["Event ID"])
 
     elif error < error_thresholds[1]:  # 🔧 Moderate error
@@ -101,7 +113,7 @@ def learn_from_emotional_error(bias_meter,emotional_timeline,contradiction_log,e
         else:
             contradiction_logged = True
             new_mem = {
-                "Event ID": f"event_{uuid.uuid4().hex[:6]}",
+                "Event ID": new_event_id(),
                 "Assigned Emotion": actual["Assigned Emotion"],
                 "Emotion Intensity": round(actual["Emotion Intensity"], 2),
                 "Raw Text": new_event.get("Raw Text", ""),
@@ -131,12 +143,12 @@ def learn_from_emotional_error(bias_meter,emotional_timeline,contradiction_log,e
         if match:
             for mem in top_supporting:
                 if mem["Assigned Emotion"] == predicted["Predicted Emotion"]:
-                    mem["Emotion Intensity"] = round(max(mem["Emotion Intensity"] - 0.2, 0.0), 2)
+                    mem["Emotion Intensity"] = round(max(mem["Emotion Intensity"] - penalty_step, 0.0), 2)
                     updates.append(mem["Event ID"])
         else:
             contradiction_logged = True
             new_mem = {
-                "Event ID": f"event_{uuid.uuid4().hex[:6]}",
+                "Event ID": new_event_id(),
                 "Assigned Emotion": actual["Assigned Emotion"],
                 "Emotion Intensity": round(actual["Emotion Intensity"], 2),
                 "Raw Text": new_event.get("Raw Text", ""),
@@ -1,3 +1,8 @@
+from contextlib import contextmanager
+import json
+import sqlite3
+from pathlib import Path
+
 def store_memory(emotional_memory_stack,event, emotion_tag):
     """Combines sensory event and emotional tag into a structured memory unit."""
     memory_unit = {
@@ -19,3 +24,281 @@ def store_memory(emotional_memory_stack,event, emotion_tag):
         emotional_memory_stack["Emotion Index"][assigned_emotion].append(event["Event ID"])
     else:
         emotional_memory_stack["Emotion Index"][assigned_emotion] = [event["Event ID"]]
+
+
+
+# --------------------------------------------------------------------------------------
+# Disk-backed memory stack
+#
+# SQLiteMemoryStack exposes the same shape as the in-memory dictionary
+# ({"Memory List": [...], "Emotion Index": {emotion: [...]}}), so store_memory,
+# predict_emotion and learn_from_emotional_error work on it unchanged. Memories
+# are streamed from disk on iteration, so a stack can grow beyond RAM, and the
+# database opens instantly and can be shared read-only by several processes.
+# --------------------------------------------------------------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    id INTEGER PRIMARY KEY,
+    event_id TEXT NOT NULL,
+    emotion TEXT,
+    intensity REAL,
+    social TEXT,
+    temporal TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memories_event_id ON memories (event_id);
+CREATE INDEX IF NOT EXISTS memories_emotion ON memories (emotion, intensity);
+CREATE TABLE IF NOT EXISTS memory_features (
+    memory_id INTEGER NOT NULL REFERENCES memories (id),
+    feature TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memory_features_feature ON memory_features (feature);
+CREATE TABLE IF NOT EXISTS emotion_index (
+    id INTEGER PRIMARY KEY,
+    emotion TEXT NOT NULL,
+    event_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS emotion_index_emotion ON emotion_index (emotion);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _context_key(value):
+    # Canonical text for Social/Temporal Context so equal dicts compare equal in SQL.
+    return json.dumps(value, sort_keys=True, default=str) if value else None
+
+
+class StoredMemory(dict):
+    """A memory unit read from disk; assigning a field writes it straight back."""
+
+    def __init__(self, store, memory_id, data):
+        super().__init__(data)
+        self._store = store
+        self._memory_id = memory_id
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._store._update_memory(self._memory_id, self)
+
+
+class _MemoryList:
+    def __init__(self, store):
+        self._store = store
+
+    def __iter__(self):
+        cursor = self._store.conn.execute("SELECT id, data FROM memories ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(256)
+            if not rows:
+                return
+            for memory_id, data in rows:
+                yield StoredMemory(self._store, memory_id, json.loads(data))
+
+    def __len__(self):
+        return self._store.conn.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+
+    def append(self, memory):
+        self._store._insert_memory(memory)
+
+
+class _EmotionBucket:
+    def __init__(self, store, emotion):
+        self._store = store
+        self._emotion = emotion
+
+    def __iter__(self):
+        rows = self._store.conn.execute(
+            "SELECT event_id FROM emotion_index WHERE emotion = ? ORDER BY id", (self._emotion,))
+        return (event_id for (event_id,) in rows)
+
+    def __len__(self):
+        return self._store.conn.execute(
+            "SELECT COUNT(*) FROM emotion_index WHERE emotion = ?", (self._emotion,)).fetchone()[0]
+
+    def append(self, event_id):
+        self._store.conn.execute(
+            "INSERT INTO emotion_index (emotion, event_id) VALUES (?, ?)", (self._emotion, event_id))
+
+
+class _EmotionIndex:
+    def __init__(self, store):
+        self._store = store
+
+    def keys(self):
+        rows = self._store.conn.execute("SELECT DISTINCT emotion FROM emotion_index")
+        return [emotion for (emotion,) in rows]
+
+    def __contains__(self, emotion):
+        # Buckets are created implicitly by their first append.
+        return True
+
+    def __getitem__(self, emotion):
+        return _EmotionBucket(self._store, emotion)
+
+    def __setitem__(self, emotion, event_ids):
+        self._store.conn.execute("DELETE FROM emotion_index WHERE emotion = ?", (emotion,))
+        bucket = self[emotion]
+        for event_id in event_ids:
+            bucket.append(event_id)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(emotion, list(self[emotion])) for emotion in self.keys()]
+
+
+class SQLiteMemoryStack:
+    """
+    An emotional memory stack persisted in a SQLite database.
+
+    Args:
+        path: Database file; created with the schema on first use.
+        read_only (bool): Open the database read-only so several processes can share it.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = Path(path)
+        self.read_only = read_only
+        if read_only:
+            self.conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True,
+                                        isolation_level=None, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(_SCHEMA)
+            self._add_context_columns()
+        self.conn.execute("PRAGMA mmap_size=268435456")
+        self._memory_list = _MemoryList(self)
+        self._emotion_index = _EmotionIndex(self)
+
+    def __getitem__(self, key):
+        if key == "Memory List":
+            return self._memory_list
+        if key == "Emotion Index":
+            return self._emotion_index
+        raise KeyError(key)
+
+    def _add_context_columns(self):
+        # Stores created before the social/temporal columns existed get them added
+        # and backfilled from the stored JSON, so candidate_memories sees every row.
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(memories)")}
+        if "social" not in columns:
+            with self._transaction():
+                self.conn.execute("ALTER TABLE memories ADD COLUMN social TEXT")
+                self.conn.execute("ALTER TABLE memories ADD COLUMN temporal TEXT")
+                for memory_id, data in self.conn.execute("SELECT id, data FROM memories").fetchall():
+                    memory = json.loads(data)
+                    self.conn.execute(
+                        "UPDATE memories SET social = ?, temporal = ? WHERE id = ?",
+                        (_context_key(memory.get("Social Context")), _context_key(memory.get("Temporal Context")), memory_id))
+        self.conn.execute("CREATE INDEX IF NOT EXISTS memories_social ON memories (social)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS memories_temporal ON memories (temporal)")
+
+    @contextmanager
+    def _transaction(self):
+        # The connection runs in autocommit mode, so multi-statement writes need an
+        # explicit BEGIN to be applied atomically.
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _insert_memory(self, memory):
+        with self._transaction():
+            cursor = self.conn.execute(
+                "INSERT INTO memories (event_id, emotion, intensity, social, temporal, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (memory["Event ID"], memory.get("Assigned Emotion"), memory.get("Emotion Intensity"),
+                 _context_key(memory.get("Social Context")), _context_key(memory.get("Temporal Context")),
+                 json.dumps(memory, default=str)))
+            self.conn.executemany(
+                "INSERT INTO memory_features (memory_id, feature) VALUES (?, ?)",
+                [(cursor.lastrowid, feature) for feature in memory.get("Sensory Features") or []])
+
+    def _update_memory(self, memory_id, memory):
+        self.conn.execute(
+            "UPDATE memories SET emotion = ?, intensity = ?, social = ?, temporal = ?, data = ? WHERE id = ?",
+            (memory.get("Assigned Emotion"), memory.get("Emotion Intensity"),
+             _context_key(memory.get("Social Context")), _context_key(memory.get("Temporal Context")),
+             json.dumps(memory, default=str), memory_id))
+
+    def _select_memories(self, where, params):
+        rows = self.conn.execute(f"SELECT id, data FROM memories WHERE {where} ORDER BY id", params)
+        for memory_id, data in rows.fetchall():
+            yield StoredMemory(self, memory_id, json.loads(data))
+
+    def memories_with_features(self, features):
+        """Yields only memories sharing at least one sensory feature, using the feature index."""
+        features = list(features)
+        if not features:
+            return
+        placeholders = ",".join("?" * len(features))
+        yield from self._select_memories(
+            f"id IN (SELECT memory_id FROM memory_features WHERE feature IN ({placeholders}))", features)
+
+    def candidate_memories(self, event):
+        """
+        Yields, in storage order, every memory that can have non-zero similarity to `event`.
+
+        compute_similarity only scores memories that share a sensory feature or have
+        the same Social or Temporal Context, so the feature, social and temporal
+        indexes select exactly those rows without decoding the rest.
+        """
+        clauses, params = [], []
+        features = list(event.get("Sensory Features") or [])
+        if features:
+            clauses.append(f"id IN (SELECT memory_id FROM memory_features WHERE feature IN ({','.join('?' * len(features))}))")
+            params.extend(features)
+        for column, field in (("social", "Social Context"), ("temporal", "Temporal Context")):
+            key = _context_key(event.get(field))
+            if key is not None:
+                clauses.append(f"{column} = ?")
+                params.append(key)
+        if clauses:
+            yield from self._select_memories(" OR ".join(clauses), params)
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def clear(self):
+        """Deletes every memory, index entry and metadata value."""
+        with self._transaction():
+            for table in ("memory_features", "memories", "emotion_index", "meta"):
+                self.conn.execute(f"DELETE FROM {table}")
+
+    def snapshot(self, path):
+        """Writes a compact, consistent copy of the store to `path`, replacing any existing file."""
+        path = Path(path)
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+        self.conn.execute("VACUUM INTO ?", (str(path),))
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path, path):
+        """Opens a fresh working store at `path` initialised from a snapshot, which is left untouched."""
+        path = Path(path)
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+        source = cls(snapshot_path, read_only=True)
+        target = sqlite3.connect(path)
+        try:
+            source.conn.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return cls(path)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,220 @@
+# replay.py
+
+# Records the perception outputs of a live run (events, High Road tags and
+# entities) so the deterministic learning loop can be re-run offline. A replay
+# seeds the memory stack once from the recorded Phase 1 output, then evaluates
+# many learning-rule parameter configurations in parallel worker processes,
+# without a single LLM call.
+
+from itertools import count, product
+from multiprocessing import Pool
+from typing import Dict, List
+import argparse
+import copy
+
+from src.helper import extract_clean_emotion
+from src.learn import predict_emotion, learn_from_emotional_error, generate_bias_shift_report
+from src.memory_storage import store_memory
+from src.results_io import RecordStream, iter_records
+
+# The parameter values hard-coded in main.py's run.
+DEFAULT_PARAMS = {
+    "error_thresholds": (0.2, 0.5),
+    "reinforce_step": 0.05,
+    "penalty_step": 0.2,
+    "k": 5,
+    "social_bonus": 0.5,
+    "temporal_bonus": 0.5,
+}
+
+EMOTIONS = ["Joy", "Sadness", "Fear", "Anger", "Curiosity", "Love/Attachment"]
+
+
+class PerceptionRecorder:
+    """
+    Streams one record per perceived event to a JSONL recording.
+
+    A record is held back until the next event arrives (or the recorder closes)
+    so the entities extracted later in the same loop iteration can be attached.
+    """
+
+    def __init__(self, path):
+        self._stream = RecordStream(path)
+        self._pending = None
+
+    def record(self, phase: int, event: Dict, tag: Dict):
+        self._flush()
+        self._pending = {"phase": phase, "event": copy.deepcopy(event), "tag": copy.deepcopy(tag), "entities": None}
+
+    def add_entities(self, entities):
+        if self._pending is not None:
+            self._pending["entities"] = list(entities) if entities else []
+
+    def _flush(self):
+        if self._pending is not None:
+            self._stream.write(self._pending)
+            self._pending = None
+
+    def extend(self, records):
+        """Writes already complete records, e.g. the Phase 1 records a warm start carries over."""
+        self._flush()
+        self._stream.write_many(records)
+
+    def flush(self):
+        """Writes out the held-back record and flushes the file so it can be read back."""
+        self._flush()
+        self._stream.flush()
+
+    def close(self):
+        self._flush()
+        self._stream.close()
+
+
+def load_recording(path):
+    """Splits a recording into its Phase 1 and Phase 2 records."""
+    phase1, phase2 = [], []
+    for record in iter_records(path):
+        (phase1 if record["phase"] == 1 else phase2).append(record)
+    return phase1, phase2
+
+
+def seed_memory_stack(phase1_records) -> Dict:
+    """Rebuilds the Phase 1 memory stack exactly as main.py seeds it."""
+    emotional_memory_stack = {"Memory List": [], "Emotion Index": {emotion: [] for emotion in EMOTIONS}}
+    for record in phase1_records:
+        if record["tag"] is not None:
+            store_memory(emotional_memory_stack, record["event"], record["tag"])
+    return emotional_memory_stack
+
+
+def snapshot(emotional_memory_stack) -> Dict:
+    # The learning rule only appends memories and reassigns top-level keys of
+    # existing ones, so copying each memory dict shallowly isolates a run from the
+    # shared seed without deep-copying features and context.
+    return {
+        "Memory List": [dict(mem) for mem in emotional_memory_stack["Memory List"]],
+        "Emotion Index": {emotion: list(ids) for emotion, ids in emotional_memory_stack["Emotion Index"].items()},
+    }
+
+
+def run_learning_loop(emotional_memory_stack, phase2_records, params: Dict) -> Dict:
+    """
+    Replays main.py's Phase 2 loop (predict, compare, learn, store) for one configuration.
+
+    Mutates `emotional_memory_stack`; pass a snapshot to keep the seed intact.
+    """
+    bias_meter, emotional_timeline, contradiction_log = {}, {}, []
+    # Sequential IDs instead of uuids: IDs break similarity ties, so random IDs would
+    # make retrieval, and therefore the results, differ between identical runs.
+    replay_ids = count(1)
+    new_event_id = lambda: f"replay_{next(replay_ids)}"
+    similarity = {"social_bonus": params["social_bonus"], "temporal_bonus": params["temporal_bonus"]}
+    stats = {"total_events": 0, "contradictions": 0, "new_memories_added": 0, "prediction_errors": [], "shifted_concepts": set()}
+
+    for record in phase2_records:
+        event = record["event"]
+        stats["total_events"] += 1
+        predicted = predict_emotion(emotional_memory_stack, event, k=params["k"], **similarity)
+
+        if record["tag"] is None:
+            continue
+        actual = dict(record["tag"])
+        cleaned_emotion = extract_clean_emotion(actual.get("Assigned Emotion", ""))
+        if cleaned_emotion == "Unknown":
+            continue
+        actual["Assigned Emotion"] = cleaned_emotion
+
+        learning_result, bias_meter, emotional_timeline, contradiction_log = learn_from_emotional_error(
+            bias_meter, emotional_timeline, contradiction_log, emotional_memory_stack,
+            new_event=event, predicted=predicted, actual=actual,
+            error_thresholds=tuple(params["error_thresholds"]),
+            reinforce_step=params["reinforce_step"], penalty_step=params["penalty_step"],
+            new_event_id=new_event_id, **similarity
+        )
+
+        stats["prediction_errors"].append(learning_result["Error"])
+        if learning_result["Contradiction Logged"]:
+            stats["contradictions"] += 1
+        if learning_result["New Memory Added"]:
+            stats["new_memories_added"] += 1
+            store_memory(emotional_memory_stack, event, actual)
+
+            concept = event["Sensory Features"][0] if event.get("Sensory Features") else "unknown"
+            report = generate_bias_shift_report(emotional_timeline, concept)
+            if report.get("Shift Detected", False):
+                stats["shifted_concepts"].add(concept)
+
+    errors = stats["prediction_errors"]
+    return {
+        **params,
+        "average_error": sum(errors) / len(errors) if errors else 0.0,
+        "contradictions": stats["contradictions"],
+        "new_memories_added": stats["new_memories_added"],
+        "shifted_concepts": len(stats["shifted_concepts"]),
+    }
+
+
+# --- Worker state. With the fork start method the seeded stack is inherited
+# copy-on-write rather than pickled into every worker.
+_seeded_stack = None
+_phase2_records = None
+
+
+def _init_worker(seeded_stack, phase2_records):
+    global _seeded_stack, _phase2_records
+    _seeded_stack = seeded_stack
+    _phase2_records = phase2_records
+
+
+def _run_config(params):
+    return run_learning_loop(snapshot(_seeded_stack), _phase2_records, params)
+
+
+def parameter_grid(**axes) -> List[Dict]:
+    """Expands lists of candidate values into configurations; unspecified parameters keep their defaults."""
+    names = list(axes)
+    return [{**DEFAULT_PARAMS, **dict(zip(names, values))} for values in product(*(axes[n] for n in names))]
+
+
+def sweep(recording_path, configs: List[Dict], processes=None) -> List[Dict]:
+    """
+    Evaluates every configuration against one recording, in parallel across processes.
+
+    Returns:
+        list: One result row per configuration, in input order.
+    """
+    phase1, phase2 = load_recording(recording_path)
+    seeded_stack = seed_memory_stack(phase1)
+    configs = [{**DEFAULT_PARAMS, **config} for config in configs]
+    if processes == 1:
+        _init_worker(seeded_stack, phase2)
+        return [_run_config(config) for config in configs]
+    with Pool(processes, initializer=_init_worker, initargs=(seeded_stack, phase2)) as pool:
+        return pool.map(_run_config, configs)
+
+
+def format_table(rows: List[Dict]) -> str:
+    """Renders sweep results as a fixed-width comparison table, best average error first."""
+    columns = list(DEFAULT_PARAMS) + ["average_error", "contradictions", "new_memories_added", "shifted_concepts"]
+    cells = [[f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in columns]
+             for row in sorted(rows, key=lambda r: r["average_error"])]
+    widths = [max(len(c), *(len(line[i]) for line in cells)) if cells else len(c) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths)),
+             "  ".join("-" * w for w in widths)]
+    lines += ["  ".join(cell.ljust(w) for cell, w in zip(line, widths)) for line in cells]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded perception outputs over a grid of learning parameters.")
+    parser.add_argument("recording", nargs="?", default="results/perception_replay.jsonl")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    grid = parameter_grid(
+        error_thresholds=[(0.1, 0.4), (0.2, 0.5), (0.3, 0.6)],
+        reinforce_step=[0.02, 0.05, 0.1],
+        penalty_step=[0.1, 0.2],
+        k=[3, 5, 8],
+    )
+    print(format_table(sweep(args.recording, grid, args.processes)))
@@ -0,0 +1,226 @@
+# results_io.py
+
+# Streams simulation results to disk one record at a time and reads them back
+# lazily, so neither the writer nor any downstream tool has to hold a whole
+# results file in memory.
+
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional
+import json
+import os
+
+try:
+    import msgpack
+except ImportError:  # The binary format is optional; JSONL always works.
+    msgpack = None
+
+# Maps each supported format to the file suffix used for its result files.
+FORMAT_SUFFIXES = {"jsonl": ".jsonl", "msgpack": ".msgpack"}
+
+
+def _require_msgpack():
+    if msgpack is None:
+        raise ImportError("The 'msgpack' format requires the msgpack package (pip install msgpack).")
+
+
+def _detect_format(path: Path) -> str:
+    for fmt, suffix in FORMAT_SUFFIXES.items():
+        if path.suffix == suffix:
+            return fmt
+    raise ValueError(f"Unrecognised results file suffix: '{path.suffix}'")
+
+
+class RecordStream:
+    """
+    An append-only stream of records backed by a single JSONL or msgpack file.
+
+    Each record is serialised and handed to the file's write buffer as soon as it
+    is written, so memory use is bounded by the size of one record (plus the buffer)
+    rather than the whole file. Call flush() to make the records written so far
+    visible to other readers.
+
+    With atomic=True the records go to a temporary file that replaces `path` only
+    when the stream closes cleanly, so readers never see a partial file.
+    """
+
+    def __init__(self, path, fmt: str = "jsonl", atomic: bool = False):
+        if fmt not in FORMAT_SUFFIXES:
+            raise ValueError(f"Unknown results format: '{fmt}'")
+        self.path = Path(path)
+        self._target = self.path.with_name(self.path.name + ".tmp") if atomic else self.path
+        if fmt == "msgpack":
+            _require_msgpack()
+            self._file = open(self._target, "wb")
+            self._packer = msgpack.Packer(default=str)
+        else:
+            self._file = open(self._target, "w", encoding="utf-8")
+            self._packer = None
+        self.count = 0
+
+    def write(self, record: Dict):
+        if self._packer is not None:
+            self._file.write(self._packer.pack(record))
+        else:
+            self._file.write(json.dumps(record, default=str))
+            self._file.write("\n")
+        self.count += 1
+
+    def write_many(self, records: Iterable[Dict]):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+        if self._target != self.path:
+            os.replace(self._target, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._target != self.path:
+            # Leave the previous file in place rather than publishing a partial one.
+            self._file.close()
+            self._target.unlink(missing_ok=True)
+            return
+        self.close()
+
+
+class ResultsWriter:
+    """
+    Writes the six result sets produced by main.py as record streams.
+
+    JSONL is the default. Passing fmt="msgpack" switches the large, structured
+    outputs (memory stack, graphs and timeline) to a compact binary encoding
+    while the small summaries stay human-readable JSONL.
+    """
+
+    BINARY_CAPABLE = {"emotional_memory_stack", "attachment_graphs", "emotional_time"}
+
+    def __init__(self, results_dir="results", fmt: str = "jsonl"):
+        if fmt not in FORMAT_SUFFIXES:
+            raise ValueError(f"Unknown results format: '{fmt}'")
+        if fmt == "msgpack":
+            _require_msgpack()
+        self.results_dir = Path(results_dir)
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        self.fmt = fmt
+
+    def path_for(self, name: str) -> Path:
+        fmt = self.fmt if name in self.BINARY_CAPABLE else "jsonl"
+        return self.results_dir / f"{name}{FORMAT_SUFFIXES[fmt]}"
+
+    def open(self, name: str) -> RecordStream:
+        # Result files are rewritten in place (e.g. by service checkpoints), so each
+        # one is swapped in atomically once complete.
+        path = self.path_for(name)
+        return RecordStream(path, _detect_format(path), atomic=True)
+
+    def write_memory_stack(self, emotional_memory_stack) -> Path:
+        # One record per memory, followed by one record per Emotion Index bucket.
+        with self.open("emotional_memory_stack") as stream:
+            for memory in emotional_memory_stack["Memory List"]:
+                stream.write({"type": "memory", **memory})
+            for emotion, event_ids in emotional_memory_stack["Emotion Index"].items():
+                stream.write({"type": "index", "emotion": emotion, "event_ids": list(event_ids)})
+        return stream.path
+
+    def write_attachment_graphs(self, attachment_model) -> Path:
+        # One record per (source, target) edge of every graph.
+        with self.open("attachment_graphs") as stream:
+            stream.write_many(attachment_model.edge_records())
+        return stream.path
+
+    def write_learning_stats(self, learning_stats: Dict) -> Path:
+        with self.open("learning_stats") as stream:
+            stream.write(learning_stats)
+        return stream.path
+
+    def write_bias(self, bias_meter: Dict) -> Path:
+        with self.open("bias") as stream:
+            for concept, emotion_map in bias_meter.items():
+                stream.write({"concept": concept, "emotions": emotion_map})
+        return stream.path
+
+    def write_timeline(self, emotional_timeline: Dict) -> Path:
+        with self.open("emotional_time") as stream:
+            for concept, history in emotional_timeline.items():
+                for entry in history:
+                    stream.write({"concept": concept, **entry})
+        return stream.path
+
+    def write_contradictions(self, contradiction_log) -> Path:
+        with self.open("contradictionlog") as stream:
+            stream.write_many(contradiction_log)
+        return stream.path
+
+
+def iter_records(path, where: Optional[Callable[[Dict], bool]] = None) -> Iterator[Dict]:
+    """
+    Lazily yields records from a JSONL or msgpack results file.
+
+    Args:
+        path: Path to a file written by ResultsWriter; the format is taken from its suffix.
+        where: Optional predicate; only records for which it returns True are yielded.
+
+    Yields:
+        Dict: One decoded record at a time.
+    """
+    path = Path(path)
+    fmt = _detect_format(path)
+    if fmt == "msgpack":
+        _require_msgpack()
+        with open(path, "rb") as f:
+            for record in msgpack.Unpacker(f, raw=False):
+                if where is None or where(record):
+                    yield record
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if where is None or where(record):
+                    yield record
+
+
+def iter_memories(path, emotion: Optional[str] = None) -> Iterator[Dict]:
+    """Yields stored memories, optionally restricted to one assigned emotion."""
+    for record in iter_records(path, lambda r: r.get("type") == "memory"):
+        if emotion is None or record.get("Assigned Emotion") == emotion:
+            record.pop("type")
+            yield record
+
+
+def iter_edges(path, graph: str = "attachment_graph", source: Optional[str] = None) -> Iterator[Dict]:
+    """Yields edges of one graph from an attachment_graphs file, optionally from a single source node."""
+    for record in iter_records(path, lambda r: r.get("graph") == graph):
+        if source is None or record["source"] == source:
+            yield record
+
+
+def load_memory_stack(path) -> Dict:
+    """Rebuilds the full emotional memory stack dictionary from a memory stack file."""
+    emotional_memory_stack = {"Memory List": [], "Emotion Index": {}}
+    for record in iter_records(path):
+        if record.pop("type", None) == "index":
+            emotional_memory_stack["Emotion Index"][record["emotion"]] = record["event_ids"]
+        else:
+            emotional_memory_stack["Memory List"].append(record)
+    return emotional_memory_stack
+
+
+def load_bias(path) -> Dict:
+    """Rebuilds the bias meter dictionary (concept -> emotion counts) from a bias file."""
+    return {record["concept"]: record["emotions"] for record in iter_records(path)}
+
+
+def load_timeline(path) -> Dict:
+    """Rebuilds the emotional timeline dictionary (concept -> history entries) from a timeline file."""
+    emotional_timeline = {}
+    for record in iter_records(path):
+        emotional_timeline.setdefault(record.pop("concept"), []).append(record)
+    return emotional_timeline
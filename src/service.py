@@ -0,0 +1,372 @@
+# service.py
+
+# ======================================================================================
+# Yggdrasil Agent - Resident Ingestion Service
+#
+# Keeps the spaCy models, LLM client and the agent's learned state warm in one
+# long-running process. New diary entries or sentences are posted over a local
+# HTTP API and run through the same pipeline as main.py's Phase 2:
+# encoder -> High Road tagging -> entity extraction (concurrently, per sentence),
+# then predict -> learn -> store -> attachment update (sequentially, one event at
+# a time under a lock). State is checkpointed to disk by a background thread.
+# ======================================================================================
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, List
+import argparse
+import copy
+import json
+import threading
+import time
+import traceback
+
+from openai import APIError
+
+from src.helper import llm, extract_clean_emotion
+from src.contextualencoder import process_sentence, split_entries_into_sentences
+from src.emotionaltagger import emotional_tagging
+from src.entity_extractor import extract_entities
+from src.memory_storage import store_memory, SQLiteMemoryStack
+from src.learn import predict_emotion, learn_from_emotional_error, generate_bias_shift_report
+from src.attachmentmodeling import AuthorityAttachmentModel
+from src.results_io import ResultsWriter, iter_records, load_bias, load_memory_stack, load_timeline
+from src.dedup import PerceptionDeduplicator
+
+
+class AgentState:
+    """
+    The live, in-memory state of one agent plus the locks that guard it.
+
+    Perception (LLM calls) runs concurrently on a thread pool; everything that
+    reads or mutates the memory stack, logs or attachment graph holds learn_lock.
+    """
+
+    def __init__(self, memory_store_path=None, workers=8, dedup_threshold=8):
+        self.client = llm()
+        if memory_store_path is not None:
+            self.emotional_memory_stack = SQLiteMemoryStack(memory_store_path)
+            self.eventid = self.emotional_memory_stack.get_meta("last_event_id", 0)
+        else:
+            self.emotional_memory_stack = {
+                "Memory List": [],
+                "Emotion Index": {e: [] for e in ["Joy", "Sadness", "Fear", "Anger", "Curiosity", "Love/Attachment"]}
+            }
+            self.eventid = 0
+        self.bias_meter = {}
+        self.emotional_timeline = {}
+        self.contradiction_log = []
+        self.attachment_model = AuthorityAttachmentModel()
+        self.dedup = PerceptionDeduplicator(threshold=dedup_threshold)
+
+        self.learn_lock = threading.Lock()
+        self._id_lock = threading.Lock()
+        self._dedup_lock = threading.Lock()
+        self._segment_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.dirty = False
+        self.events_learned = 0
+
+    # --- Perception (concurrent).
+
+    def _next_event_id(self) -> int:
+        with self._id_lock:
+            self.eventid += 1
+            return self.eventid
+
+    def _perceive_stage(self, stage, text, compute, overrides=None):
+        # Dedup lookups are cheap and serialised; the LLM call itself runs unlocked.
+        with self._dedup_lock:
+            result = self.dedup.lookup(stage, text, overrides)
+        if result is None:
+            result = compute()
+            with self._dedup_lock:
+                self.dedup.store(stage, text, result)
+        return result
+
+    def perceive(self, sentence: str) -> Dict:
+        """Runs the encoder, High Road tagging and entity extraction for one sentence."""
+        idx = self._next_event_id()
+        event = self._perceive_stage(
+            "encoder", sentence, lambda: process_sentence(self.client, sentence, idx),
+            {"Event ID": f"event_{idx}", "Raw Text": sentence})
+        if not event:
+            return {"sentence": sentence, "event": None, "tag": None, "entities": []}
+        raw_text = event.get("Raw Text", "")
+        tag = self._perceive_stage(
+            "tagger", raw_text, lambda: emotional_tagging(self.client, event), {"Event ID": event.get("Event ID")})
+        entities = []
+        if raw_text:
+            entities = self._perceive_stage("entities", raw_text, lambda: extract_entities(self.client, raw_text)) or []
+        return {"sentence": sentence, "event": event, "tag": tag, "entities": entities}
+
+    def segment(self, entries: List[str]) -> List[str]:
+        with self._segment_lock:
+            return [sentence for sentences in split_entries_into_sentences(entries) for sentence in sentences]
+
+    # --- Learning (sequential).
+
+    def learn(self, perceived: Dict) -> Dict:
+        """Applies main.py's Phase 2 learning step to one perceived event."""
+        event, actual = perceived["event"], perceived["tag"]
+        result = {"Event ID": event.get("Event ID") if event else None, "Raw Text": perceived["sentence"]}
+        if not event or actual is None:
+            result["Skipped"] = "perception failed"
+            return result
+
+        actual = dict(actual)
+        cleaned_emotion = extract_clean_emotion(actual.get("Assigned Emotion", ""))
+        if cleaned_emotion == "Unknown":
+            result["Skipped"] = "unknown emotion"
+            return result
+        actual["Assigned Emotion"] = cleaned_emotion
+
+        with self.learn_lock:
+            predicted = predict_emotion(self.emotional_memory_stack, event)
+            learning_result, self.bias_meter, self.emotional_timeline, self.contradiction_log = learn_from_emotional_error(
+                self.bias_meter, self.emotional_timeline, self.contradiction_log, self.emotional_memory_stack,
+                new_event=event, predicted=predicted, actual=actual
+            )
+            if learning_result["New Memory Added"]:
+                store_memory(self.emotional_memory_stack, event, actual)
+            if perceived["entities"]:
+                self.attachment_model.process_event(
+                    event.get("Raw Text", ""), perceived["entities"], actual["Assigned Emotion"], actual["Emotion Intensity"])
+            self.events_learned += 1
+            self.dirty = True
+
+        result.update({
+            "Predicted": predicted,
+            "Actual": actual,
+            "Entities": perceived["entities"],
+            "Learning Result": learning_result,
+        })
+        return result
+
+    def ingest(self, sentences: List[str]) -> List[Dict]:
+        """Perceives all sentences concurrently, then learns from them in order."""
+        perceived = list(self.executor.map(self.perceive, sentences))
+        return [self.learn(p) for p in perceived]
+
+    # --- Queries.
+
+    def predict(self, event: Dict) -> Dict:
+        with self.learn_lock:
+            return predict_emotion(self.emotional_memory_stack, event)
+
+    def strongest_attachments(self, limit: int) -> Dict:
+        with self.learn_lock:
+            attachments = [{"entity": entity, "weight": data["weight"]}
+                           for entity, data in self.attachment_model.get_strongest_attachments(limit)]
+            pairs = [{"entities": list(pair), "weight": edge["weight"], "emotions": dict(edge["emotions"])}
+                     for pair, edge in self.attachment_model.get_strongest_pairs(limit)]
+        return {"attachments": attachments, "pairs": pairs}
+
+    def bias_report(self, concept=None) -> Dict:
+        with self.learn_lock:
+            if concept is None:
+                return {"concepts": {c: dict(emotions) for c, emotions in self.bias_meter.items()}}
+            return {"bias": dict(self.bias_meter.get(concept, {})),
+                    "shift": generate_bias_shift_report(self.emotional_timeline, concept)}
+
+    def status(self) -> Dict:
+        with self.learn_lock:
+            return {
+                "memories": len(self.emotional_memory_stack["Memory List"]),
+                "events_learned": self.events_learned,
+                "contradictions": len(self.contradiction_log),
+                "llm_calls_avoided": self.dedup.report()["llm_calls_avoided"],
+            }
+
+    # --- Checkpointing.
+
+    def restore(self, writer: ResultsWriter) -> bool:
+        """Reloads the last complete checkpoint from writer.results_dir; returns False if there is none."""
+        stats_path = writer.path_for("learning_stats")
+        if not stats_path.exists():
+            return False
+        with self.learn_lock:
+            stats = next(iter_records(stats_path), {})
+            # Never reissue an ID, whether the SQLite store or the checkpoint is further ahead.
+            self.eventid = max(self.eventid, stats.get("last_event_id", 0))
+            self.events_learned = stats.get("events_learned", 0)
+            stack_path = writer.path_for("emotional_memory_stack")
+            if not isinstance(self.emotional_memory_stack, SQLiteMemoryStack) and stack_path.exists():
+                self.emotional_memory_stack = load_memory_stack(stack_path)
+            if writer.path_for("attachment_graphs").exists():
+                self.attachment_model = AuthorityAttachmentModel.from_edge_records(
+                    iter_records(writer.path_for("attachment_graphs")))
+            if writer.path_for("bias").exists():
+                self.bias_meter = load_bias(writer.path_for("bias"))
+            if writer.path_for("emotional_time").exists():
+                self.emotional_timeline = load_timeline(writer.path_for("emotional_time"))
+            if writer.path_for("contradictionlog").exists():
+                self.contradiction_log = list(iter_records(writer.path_for("contradictionlog")))
+        return True
+
+    def checkpoint(self, writer: ResultsWriter):
+        """Snapshots state under the lock, then writes it without blocking learning."""
+        with self.learn_lock:
+            if not self.dirty:
+                return False
+            in_memory_stack = not isinstance(self.emotional_memory_stack, SQLiteMemoryStack)
+            snapshot = copy.deepcopy({
+                "stack": self.emotional_memory_stack if in_memory_stack else None,
+                "attachment_model": self.attachment_model,
+                "bias_meter": self.bias_meter,
+                "emotional_timeline": self.emotional_timeline,
+                "contradiction_log": self.contradiction_log,
+                "stats": {"last_event_id": self.eventid, "events_learned": self.events_learned},
+            })
+            if not in_memory_stack:
+                self.emotional_memory_stack.set_meta("last_event_id", self.eventid)
+            self.dirty = False
+
+        if snapshot["stack"] is not None:
+            writer.write_memory_stack(snapshot["stack"])
+        writer.write_attachment_graphs(snapshot["attachment_model"])
+        writer.write_bias(snapshot["bias_meter"])
+        writer.write_timeline(snapshot["emotional_timeline"])
+        writer.write_contradictions(snapshot["contradiction_log"])
+        # Written last: its presence marks a complete checkpoint for restore().
+        writer.write_learning_stats(snapshot["stats"])
+        return True
+
+
+def start_checkpointer(state: AgentState, writer: ResultsWriter, interval: float) -> threading.Thread:
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                if state.checkpoint(writer):
+                    print(f"[checkpoint] state written to {writer.results_dir}")
+            except Exception as e:
+                print(f"[⚠️] Checkpoint failed: {e}")
+
+    thread = threading.Thread(target=run, name="checkpointer", daemon=True)
+    thread.start()
+    return thread
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    JSON API:
+        POST /entries     {"entries": ["<diary entry>", ...]}  -> learning results
+        POST /sentences   {"sentences": ["<sentence>", ...]}   -> learning results
+        POST /predict     {"event": {...}}                     -> predicted emotion
+        GET  /attachments?limit=5                              -> strongest attachments & pairs
+        GET  /bias[?concept=<name>]                            -> bias meter / shift report
+        GET  /status                                           -> state summary
+    """
+
+    state: AgentState = None
+
+    def _send(self, status: int, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _respond(self, handler):
+        # Runs a validated request; upstream LLM failures and internal errors become JSON error responses.
+        try:
+            payload = handler()
+        except APIError as e:
+            self._send(502, {"error": f"LLM request failed: {e}"})
+        except Exception as e:
+            traceback.print_exc()
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+        else:
+            self._send(200, payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/attachments":
+            try:
+                limit = int(query.get("limit", ["5"])[0])
+            except ValueError:
+                self._send(400, {"error": "'limit' must be an integer"})
+                return
+            self._respond(lambda: self.state.strongest_attachments(limit))
+        elif url.path == "/bias":
+            self._respond(lambda: self.state.bias_report(query.get("concept", [None])[0]))
+        elif url.path == "/status":
+            self._respond(self.state.status)
+        else:
+            self._send(404, {"error": f"Unknown endpoint '{url.path}'"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        try:
+            payload = self._read_json()
+        except ValueError as e:  # Malformed JSON, bad encoding or Content-Length.
+            self._send(400, {"error": f"Invalid JSON body: {e}"})
+            return
+        if not isinstance(payload, dict):
+            self._send(400, {"error": f"Expected a JSON object, got {type(payload).__name__}"})
+            return
+
+        if path == "/entries":
+            entries = payload.get("entries") or ([payload["text"]] if "text" in payload else [])
+            if not _is_string_list(entries):
+                self._send(400, {"error": "'entries' must be a list of strings (or 'text' a string)"})
+                return
+            self._respond(lambda: {"results": self.state.ingest(self.state.segment(entries))})
+        elif path == "/sentences":
+            sentences = payload.get("sentences", [])
+            if not _is_string_list(sentences):
+                self._send(400, {"error": "'sentences' must be a list of strings"})
+                return
+            self._respond(lambda: {"results": self.state.ingest(sentences)})
+        elif path == "/predict":
+            if not isinstance(payload.get("event"), dict):
+                self._send(400, {"error": "'event' must be a JSON object"})
+                return
+            self._respond(lambda: self.state.predict(payload["event"]))
+        else:
+            self._send(404, {"error": f"Unknown endpoint '{path}'"})
+
+
+def _is_string_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+def serve(host="127.0.0.1", port=8765, memory_store_path=None, checkpoint_dir="results/service",
+          checkpoint_interval=30.0, workers=8):
+    state = AgentState(memory_store_path=memory_store_path, workers=workers)
+    writer = ResultsWriter(checkpoint_dir)
+    if state.restore(writer):
+        print(f"Restored state from {checkpoint_dir}: {state.status()['memories']} memories, last event {state.eventid}")
+    start_checkpointer(state, writer, checkpoint_interval)
+
+    ServiceHandler.state = state
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    print(f"Yggdrasil service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        state.checkpoint(writer)
+        state.executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Yggdrasil agent as a resident ingestion service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--memory-store", default=None, help="SQLite memory store to warm-start from and persist to.")
+    parser.add_argument("--checkpoint-dir", default="results/service")
+    parser.add_argument("--checkpoint-interval", type=float, default=30.0, help="Seconds between background checkpoints.")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent perception (LLM) workers.")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.memory_store, args.checkpoint_dir, args.checkpoint_interval, args.workers)
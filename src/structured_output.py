@@ -0,0 +1,229 @@
+# structured_output.py
+
+# One structured-output path for every LLM stage. Each stage declares a JSON
+# schema; the schema is sent as response_format on endpoints that support it, and
+# every response, constrained or not, goes through the same parser and validator.
+# Responses that still fail are re-asked once with the validation errors, and
+# failures are counted per stage instead of silently turning into defaults.
+
+from typing import Dict, List, Optional, Tuple
+import json
+import threading
+
+from src.helper import JSONCloseScanner, decode_json_span, get_response
+
+EMOTIONS = ["Joy", "Sadness", "Fear", "Anger", "Curiosity", "Love/Attachment"]
+
+STAGE_SCHEMAS = {
+    "encoder": {
+        "title": "sensory_event",
+        "type": "object",
+        "required": ["Event ID", "Sensory Features", "Temporal Context", "Social Context", "Raw Text"],
+        "properties": {
+            "Event ID": {"type": "string"},
+            "Sensory Features": {"type": "array", "items": {"type": "string"}},
+            "Temporal Context": {
+                "type": "object",
+                "required": ["TimeOfDay", "Urgency"],
+                "properties": {
+                    "TimeOfDay": {"type": "string"},
+                    "Urgency": {"type": "string", "enum": ["Urgent", "Peaceful", "Neutral"]},
+                },
+            },
+            "Social Context": {"type": "string"},
+            "Raw Text": {"type": "string"},
+        },
+    },
+    "tagger": {
+        "title": "emotional_tag",
+        "type": "object",
+        "required": ["Assigned Emotion", "Emotion Intensity"],
+        "properties": {
+            # Optional: emotional_tagging overwrites it with the event's own ID.
+            "Event ID": {"type": ["string", "integer"]},
+            "Assigned Emotion": {"type": "string", "enum": EMOTIONS},
+            "Emotion Intensity": {"type": "number", "minimum": 0.0, "maximum": 1.0},
+        },
+    },
+    "entities": {
+        "title": "entities",
+        "type": "array",
+        "items": {"type": "string"},
+    },
+}
+
+def event_confidence(event: Dict) -> float:
+    """Scores a schema-valid encoder event by the share of its required fields that are non-empty."""
+    fields = STAGE_SCHEMAS["encoder"]["required"]
+    return sum(1 for field in fields if event[field]) / len(fields)
+
+
+# Stages whose schema-valid output can still be weak; the cascade escalates when the
+# score is below the tier's "min_confidence". Other stages are accepted once valid.
+STAGE_CONFIDENCE = {
+    "encoder": event_confidence,
+}
+
+# response_format schemas must have an object at the root, so list-valued stages
+# are requested wrapped in a single key and unwrapped by the parser.
+_WRAPPED_KEY = "items"
+
+# --- Per-stage parse bookkeeping, summarised by parse_failure_report().
+parse_stats = {}
+_stats_lock = threading.Lock()
+
+_TYPES = {"object": dict, "array": list, "string": str, "boolean": bool, "integer": int}
+
+
+def _request_schema(stage: str) -> Dict:
+    schema = STAGE_SCHEMAS[stage]
+    if schema["type"] == "object":
+        return schema
+    return {"title": schema["title"], "type": "object", "required": [_WRAPPED_KEY], "properties": {_WRAPPED_KEY: schema}}
+
+
+def validate_schema(value, schema: Dict, path: str = "$") -> List[str]:
+    """Checks a decoded value against the JSON-schema subset used by STAGE_SCHEMAS and returns any errors."""
+    expected = schema.get("type")
+    if isinstance(expected, list):
+        if any(not validate_schema(value, {**schema, "type": t}, path) for t in expected):
+            return []
+        return [f"{path}: expected one of {expected}, got {type(value).__name__}"]
+    if expected == "integer" and isinstance(value, bool):
+        return [f"{path}: expected integer, got bool"]
+    if expected == "number":
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return [f"{path}: expected number, got {type(value).__name__}"]
+        errors = []
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path}: {value} is below {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path}: {value} is above {schema['maximum']}")
+        return errors
+    if expected in _TYPES and not isinstance(value, _TYPES[expected]):
+        return [f"{path}: expected {expected}, got {type(value).__name__}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path}: {value!r} is not one of {schema['enum']}"]
+
+    errors = []
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing field '{key}'")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate_schema(value[key], subschema, f"{path}.{key}"))
+    elif expected == "array" and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate_schema(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+def _json_root(stage: str) -> Optional[str]:
+    # Object stages must answer with an object; list stages may answer with a bare
+    # array or with the {"items": [...]} wrapper requested via response_format.
+    return "object" if STAGE_SCHEMAS[stage]["type"] == "object" else None
+
+
+def parse_json_value(text: str, root: str = None):
+    """
+    Decodes the first complete, decodable JSON object or array in `text`.
+
+    The span is located with the same string-aware bracket scanner used for
+    streaming, so explanations, code fences or bracketed asides around the value
+    are ignored. Python-style literals (single quotes) are accepted as a fallback.
+
+    Raises:
+        ValueError: If no complete, decodable value is present.
+    """
+    scanner = JSONCloseScanner(root)
+    end = scanner.feed(text or "")
+    if end is None:
+        raise ValueError("no complete JSON object or array in response")
+    return decode_json_span(scanner.text[scanner.start:end])
+
+
+def normalize_enums(value, schema: Dict):
+    """Maps enum strings that differ only in case or surrounding whitespace onto their canonical spelling."""
+    if "enum" in schema and isinstance(value, str):
+        canonical = {option.lower(): option for option in schema["enum"] if isinstance(option, str)}
+        return canonical.get(value.strip().lower(), value)
+    if schema.get("type") == "object" and isinstance(value, dict):
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                value[key] = normalize_enums(value[key], subschema)
+    elif schema.get("type") == "array" and isinstance(value, list) and "items" in schema:
+        value[:] = [normalize_enums(item, schema["items"]) for item in value]
+    return value
+
+
+def parse_structured(stage: str, text: str) -> Tuple[Optional[object], List[str]]:
+    """Parses and validates a response for `stage`; returns (value, errors), with value None on failure."""
+    try:
+        value = parse_json_value(text, _json_root(stage))
+    except ValueError as e:
+        return None, [str(e)]
+    schema = STAGE_SCHEMAS[stage]
+    if schema["type"] != "object" and isinstance(value, dict) and _WRAPPED_KEY in value:
+        value = value[_WRAPPED_KEY]
+    value = normalize_enums(value, schema)
+    errors = validate_schema(value, schema)
+    return (None, errors) if errors else (value, [])
+
+
+def _count(stage: str, *fields: str):
+    with _stats_lock:
+        stats = parse_stats.setdefault(stage, {"calls": 0, "parse_failures": 0, "reasks": 0, "recovered": 0, "unusable": 0})
+        for field in fields:
+            stats[field] += 1
+
+
+def structured_response(client, stage: str, prompt: str, reasks: int = 1):
+    """
+    Requests schema-valid output for one item, re-asking only if it fails validation.
+
+    Args:
+        client: The initialized API client.
+        stage (str): A key of STAGE_SCHEMAS; also selects the model route.
+        prompt (str): The stage prompt.
+        reasks (int): How many corrective follow-up requests to allow.
+
+    Returns:
+        The validated value, or None if every attempt was unusable.
+    """
+    _count(stage, "calls")
+    schema = _request_schema(stage)
+
+    def is_valid(text):
+        value, errors = parse_structured(stage, text)
+        if errors:
+            return 0.0 if stage in STAGE_CONFIDENCE else False
+        return STAGE_CONFIDENCE[stage](value) if stage in STAGE_CONFIDENCE else True
+
+    response = get_response(client, prompt, stage=stage, validate=is_valid, schema=schema, json_root=_json_root(stage))
+    value, errors = parse_structured(stage, response)
+    attempt = 0
+    while errors:
+        if attempt >= reasks:
+            _count(stage, "parse_failures", "unusable")
+            print(f"[⚠️] Unusable {stage} output after {attempt} re-ask(s): {'; '.join(errors[:3])}")
+            return None
+        attempt += 1
+        _count(stage, "parse_failures", "reasks")
+        correction = (
+            f"{prompt}\n\n"
+            f"Your previous response could not be used:\n{response}\n\n"
+            f"Problems: {'; '.join(errors[:5])}\n"
+            f"Respond again with ONLY valid JSON matching this schema:\n{json.dumps(STAGE_SCHEMAS[stage])}"
+        )
+        response = get_response(client, correction, stage=stage, validate=is_valid, schema=schema, json_root=_json_root(stage))
+        value, errors = parse_structured(stage, response)
+        if not errors:
+            _count(stage, "recovered")
+    return value
+
+
+def parse_failure_report() -> Dict:
+    """Returns per-stage counts of calls, parse failures, re-asks, recoveries and unusable outputs."""
+    with _stats_lock:
+        return {stage: dict(stats) for stage, stats in parse_stats.items()}